@@ -0,0 +1,57 @@
+import wave
+import numpy as np
+
+# 🔊 טביעת אצבע קולית (spectral-peak hashing) לזיהוי מדיה זהה שקודדה מחדש
+# עובד על PCM של 8kHz מונו 16bit – כמו הפלט של convert_to_wav
+
+FRAME_SIZE = 1024           # 128ms ב-8kHz
+HOP_SIZE = 512              # 64ms בין מסגרות
+BANDS = (4, 16, 32, 64, 128, 256, 513)  # גבולות פסי התדר (באינדקסי FFT)
+TARGET_DELTAS = (1, 2, 3)   # מרחק (במסגרות) בין שיא העוגן לשיא המטרה
+MAX_SECONDS = 90            # טביעה רק על תחילת הקובץ – מספיק לזיהוי ומגביל את גודל האינדקס
+
+
+def read_pcm(wav_path):
+    """קורא קובץ WAV מונו 16bit למערך int16"""
+    with wave.open(wav_path, 'rb') as wf:
+        frames = wf.readframes(min(wf.getnframes(), wf.getframerate() * MAX_SECONDS))
+    return np.frombuffer(frames, dtype='<i2')
+
+
+def compute_fingerprint(samples):
+    """
+    מחזיר רשימת (hash, frame) – זוגות של שיאים ספקטרליים באותו פס תדר.
+    כל החישוב וקטורי (numpy), בלי לולאה על המסגרות.
+    """
+    if len(samples) < FRAME_SIZE * 2:
+        return []
+
+    x = samples.astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(x, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE), axis=1))
+    log_spec = np.log1p(spectrum)
+
+    # השיא בכל פס תדר לכל מסגרת
+    peaks = np.empty((log_spec.shape[0], len(BANDS) - 1), dtype=np.int32)
+    strengths = np.empty(peaks.shape, dtype=np.float32)
+    for b in range(len(BANDS) - 1):
+        band = log_spec[:, BANDS[b]:BANDS[b + 1]]
+        idx = band.argmax(axis=1)
+        peaks[:, b] = idx + BANDS[b]
+        strengths[:, b] = band[np.arange(band.shape[0]), idx]
+
+    # משאירים רק שיאים חזקים מהחציון של המסגרת (מסנן שקט ורעש רקע)
+    strong = strengths > np.median(strengths, axis=1, keepdims=True)
+    strong &= strengths > 1.0
+
+    hashes = []
+    for dt in TARGET_DELTAS:
+        a = peaks[:-dt]
+        t = peaks[dt:]
+        valid = strong[:-dt] & strong[dt:]
+        h = (a.astype(np.int64) << 12) | (t.astype(np.int64) << 2) | dt
+        frame_idx = np.broadcast_to(np.arange(a.shape[0])[:, None], a.shape)
+        hashes.append(np.stack([h[valid], frame_idx[valid]], axis=1))
+
+    result = np.unique(np.concatenate(hashes), axis=0)
+    return [(int(h), int(f)) for h, f in result]
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+from media_tools import convert_to_wav, decode_to_pcm, decode_backend
+
+# ⏱️ השוואת פענוח הודעות קוליות ל-PCM של 8kHz:
+#   spawn  – הדרך הישנה: כתיבה לדיסק + הפעלת ffmpeg לכל קובץ (convert_to_wav)
+#   pipe   – ffmpeg שקורא מ-stdin וכותב PCM ל-stdout, בלי קבצים
+#   av     – PyAV בתוך התהליך, בלי הפעלת תהליך בכלל (אם מותקן)
+#
+# שימוש:
+#   python bench_decode.py voice1.ogg voice2.ogg --repeat 20
+
+
+def run_spawn(data, tmp):
+    src = os.path.join(tmp, "audio.ogg")
+    dst = os.path.join(tmp, "audio.wav")
+    with open(src, "wb") as f:
+        f.write(data)
+    convert_to_wav(src, dst)
+    with open(dst, "rb") as f:
+        return len(f.read()) - 44 # בלי כותרת ה-WAV
+
+
+def run_backend(backend):
+    def run(data, tmp):
+        return len(decode_to_pcm(data, backend=backend))
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="השוואת פענוח הודעות קוליות: ffmpeg לכל קובץ מול פענוח בזיכרון")
+    parser.add_argument("inputs", nargs="+", help="קבצי ogg/opus, m4a או mp3")
+    parser.add_argument("--repeat", type=int, default=10, help="כמה פעמים לפענח כל קובץ")
+    args = parser.parse_args()
+
+    methods = {"spawn": run_spawn, "pipe": run_backend("ffmpeg")}
+    if decode_backend() == "av":
+        methods["av"] = run_backend("av")
+    else:
+        print("ℹ️ PyAV לא מותקן – מדלג על av (pip install av)\n")
+
+    files = []
+    for path in args.inputs:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+
+    header = f"{'file':<24} {'method':<6} {'median ms':>10} {'p95 ms':>8} {'pcm bytes':>10} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data in files:
+            baseline = None
+            for method, run in methods.items():
+                run(data, tmp) # חימום (טעינת ספריות, מטמון דיסק)
+                times = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    size = run(data, tmp)
+                    times.append((time.perf_counter() - started) * 1000)
+                median = statistics.median(times)
+                p95 = sorted(times)[max(0, int(len(times) * 0.95) - 1)]
+                baseline = baseline or median
+                print(f"{name[:24]:<24} {method:<6} {median:>10.1f} {p95:>8.1f} {size:>10} {baseline / median:>7.1f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
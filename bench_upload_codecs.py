@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import requests
+
+from media_tools import UPLOAD_CODECS, convert_to_wav, encode_for_upload, run_managed, ffmpeg_timeout
+
+# 📊 השוואת קידודי העלאה לימות: גודל, זמן קידוד, זמן העלאה ואיכות השמע ב-8kHz
+#
+# שימוש:
+#   python bench_upload_codecs.py sample.ogg
+#   python bench_upload_codecs.py sample.mp4 --mbps 1.5
+#   YMOT_TOKEN=... python bench_upload_codecs.py sample.mp4 --upload ivr2:99/
+#
+# איכות: מפענחים את הקובץ המקודד חזרה ל-PCM ומשווים למקור (SNR ומרחק ספקטרלי לוגריתמי).
+# ימות מקודדת מחדש ממילא (convertAudio=1), כך שמה שחשוב הוא שהקידוד שלנו לא יפגע בדיבור.
+
+
+def decode_pcm(path):
+    result = run_managed(['ffmpeg', '-nostdin', '-i', path, '-ar', '8000', '-ac', '1', '-f', 's16le', '-'],
+                         ffmpeg_timeout(path))
+    return np.frombuffer(result["stdout"], dtype='<i2').astype(np.float64)
+
+
+def align(reference, decoded):
+    """מיישר את הקובץ המפוענח למקור (ל-MP3/GSM יש השהייה קטנה בתחילת הקובץ)"""
+    n = min(len(reference), len(decoded), 8000 * 2)
+    corr = np.fft.irfft(np.fft.rfft(decoded[:n], 2 * n) * np.conj(np.fft.rfft(reference[:n], 2 * n)))
+    lag = int(np.argmax(corr[:4000]))  # עד חצי שנייה השהייה
+    decoded = decoded[lag:]
+    m = min(len(reference), len(decoded))
+    return reference[:m], decoded[:m]
+
+
+def quality(reference, decoded):
+    reference, decoded = align(reference, decoded)
+    noise = reference - decoded
+    snr = 10 * np.log10(np.sum(reference ** 2) / max(np.sum(noise ** 2), 1e-9))
+
+    def spectra(x):
+        frames = np.lib.stride_tricks.sliding_window_view(x, 256)[::128]
+        return np.log10(np.abs(np.fft.rfft(frames * np.hanning(256), axis=1)) ** 2 + 1e-6)
+
+    lsd = np.mean(np.sqrt(np.mean((10 * (spectra(reference) - spectra(decoded))) ** 2, axis=1)))
+    return snr, lsd
+
+
+def upload(path, ymot_path):
+    with open(path, 'rb') as f:
+        started = time.monotonic()
+        response = requests.post(
+            'https://call2all.co.il/ym/api/UploadFile',
+            data={'token': os.environ["YMOT_TOKEN"], 'path': ymot_path, 'convertAudio': '1', 'autoNumbering': 'true'},
+            files={'file': (os.path.basename(path), f)},
+            timeout=300,
+        )
+    response.raise_for_status()
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="השוואת קידודי העלאה לימות המשיח")
+    parser.add_argument("input", help="קובץ שמע/וידאו לבדיקה")
+    parser.add_argument("--mbps", type=float, default=2.0, help="קצב העלאה משוער (Mbit/s) לחישוב זמן העלאה")
+    parser.add_argument("--upload", metavar="YMOT_PATH", help="העלאה אמיתית לשלוחת בדיקה (דורש YMOT_TOKEN)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_wav = os.path.join(tmp, "reference.wav")
+        convert_to_wav(args.input, reference_wav)
+        reference = decode_pcm(reference_wav)
+        duration = len(reference) / 8000.0
+        print(f"🎧 {args.input}: {duration:.1f} שניות\n")
+
+        header = f"{'codec':<6} {'bytes':>10} {'ratio':>6} {'enc s':>6} {'upload s':>9} {'SNR dB':>7} {'LSD dB':>7}"
+        print(header)
+        print("-" * len(header))
+
+        base_size = None
+        for codec in UPLOAD_CODECS:
+            started = time.monotonic()
+            try:
+                encoded = encode_for_upload(reference_wav, os.path.join(tmp, f"out_{codec}"), codec)
+            except Exception as e:
+                print(f"{codec:<6} ❌ {e}")
+                continue
+            encode_time = time.monotonic() - started
+            size = os.path.getsize(encoded)
+            base_size = base_size or size
+            snr, lsd = quality(reference, decode_pcm(encoded))
+            if args.upload:
+                upload_time = upload(encoded, args.upload)
+            else:
+                upload_time = size * 8 / (args.mbps * 1_000_000)
+            print(f"{codec:<6} {size:>10} {base_size / size:>5.1f}x {encode_time:>6.2f} {upload_time:>9.2f} {snr:>7.1f} {lsd:>7.2f}")
+
+        if not args.upload:
+            print(f"\n* זמן ההעלאה משוער לפי {args.mbps} Mbit/s (ללא --upload)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
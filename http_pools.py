@@ -0,0 +1,161 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
+
+# 🌐 מאגרי חיבורים נפרדים לטלגרם: האזנה (get_updates), הורדת קבצים ושליחת הודעות/פקודות API.
+# כך הורדה של וידאו גדול לא תופסת את החיבור של ה-long polling או של הודעות השגיאה לערוץ.
+# לפני כל מאגר יש סמפור בגודל המאגר – ההמתנה לחיבור פנוי נמדדת בו (/http_stats),
+# והמתנה מעבר ל-TG_POOL_TIMEOUT נכשלת ב-TimedOut (כמו מאגר החיבורים של httpx).
+
+TG_CONNECT_TIMEOUT = float(os.getenv("TG_CONNECT_TIMEOUT", "10"))
+TG_POOL_TIMEOUT = float(os.getenv("TG_POOL_TIMEOUT", "30"))
+TG_HTTP_VERSION = os.getenv("TG_HTTP_VERSION", "1.1") # "2" – HTTP/2 (דורש pip install "httpx[http2]")
+
+TG_POLL_POOL_SIZE = int(os.getenv("TG_POLL_POOL_SIZE", "1"))
+TG_POLL_READ_TIMEOUT = float(os.getenv("TG_POLL_READ_TIMEOUT", "40")) # יותר מה-timeout של ה-long polling
+
+TG_SEND_POOL_SIZE = int(os.getenv("TG_SEND_POOL_SIZE", "8"))
+TG_SEND_READ_TIMEOUT = float(os.getenv("TG_SEND_READ_TIMEOUT", "10"))
+TG_SEND_WRITE_TIMEOUT = float(os.getenv("TG_SEND_WRITE_TIMEOUT", "30")) # גם שליחת קבצים (/export_filters)
+
+TG_DOWNLOAD_CONCURRENCY = int(os.getenv("TG_DOWNLOAD_CONCURRENCY", "2")) # הורדות במקביל = גודל המאגר
+TG_DOWNLOAD_READ_TIMEOUT = float(os.getenv("TG_DOWNLOAD_READ_TIMEOUT", "120"))
+
+HTTP_POOL_WAIT_WARN = float(os.getenv("HTTP_POOL_WAIT_WARN", "1.0")) # שניות המתנה לחיבור שמודפסות כאזהרה
+
+POOLS = [] # כל המאגרים שנוצרו, עבור /http_stats
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest עם סמפור בגודל המאגר: מודד כמה זמן בקשות ממתינות לחיבור פנוי"""
+
+    def __init__(self, name, pool_size, read_timeout, write_timeout=None):
+        super().__init__(
+            connection_pool_size=pool_size,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout or read_timeout,
+            connect_timeout=TG_CONNECT_TIMEOUT,
+            pool_timeout=TG_POOL_TIMEOUT,
+        )
+        self.http_version = "2" if self._client_kwargs.get("http2") else "1.1"
+        self.name = name
+        self.pool_size = pool_size
+        self.waits = deque(maxlen=500) # זמני ההמתנה האחרונים (שניות)
+        self.requests = 0
+        self.errors = 0
+        self.pool_timeouts = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self._loop = None
+        self._semaphore = None
+        POOLS.append(self)
+
+    def _build_client(self):
+        # ל-HTTPXRequest של PTB 20.0 אין http_version – מוסיפים http2 לפרמטרים של httpx.AsyncClient
+        # (נקרא גם מ-initialize אחרי shutdown, כך שההגדרה נשמרת בכל בנייה מחדש של הלקוח)
+        if TG_HTTP_VERSION == "2":
+            self._client_kwargs["http2"] = True
+        try:
+            return super()._build_client()
+        except ImportError as e:
+            if not self._client_kwargs.pop("http2", False):
+                raise
+            print(f"⚠️ HTTP/2 לא זמין ({e}) – ממשיך ב-HTTP/1.1.")
+            return super()._build_client()
+
+    def _get_semaphore(self):
+        # הלולאה מתחלפת בכל הפעלה מחדש של run_polling
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+        return self._semaphore
+
+    async def do_request(self, *args, **kwargs):
+        semaphore = self._get_semaphore()
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), TG_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.waits.append(time.monotonic() - started)
+            self.pool_timeouts += 1
+            self.requests += 1
+            self.errors += 1
+            print(f"🌐 אין חיבור פנוי במאגר {self.name} אחרי {TG_POOL_TIMEOUT:g} שניות ({self.pool_size} חיבורים).")
+            raise TimedOut(f"Pool timeout: no free connection in the {self.name} pool") from None
+        finally:
+            self.waiting -= 1
+        wait = time.monotonic() - started
+        self.waits.append(wait)
+        if wait >= HTTP_POOL_WAIT_WARN:
+            print(f"🌐 המתנה של {wait:.1f} שניות לחיבור פנוי במאגר {self.name} ({self.pool_size} חיבורים).")
+
+        self.in_flight += 1
+        try:
+            return await super().do_request(*args, **kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.requests += 1
+            semaphore.release()
+
+    def stats(self):
+        waits = sorted(self.waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(len(waits) * p))] * 1000 if waits else 0.0
+
+        return {
+            "name": self.name,
+            "pool_size": self.pool_size,
+            "http_version": self.http_version,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "errors": self.errors,
+            "pool_timeouts": self.pool_timeouts,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+            "wait_max_ms": waits[-1] * 1000 if waits else 0.0,
+        }
+
+
+class SplitRequest(BaseRequest):
+    """הבקשה של הבוט: הורדות קבצים (/file/bot...) למאגר ההורדות, כל שאר קריאות ה-API למאגר השליחה"""
+
+    def __init__(self, sends, downloads):
+        self.sends = sends
+        self.downloads = downloads
+
+    @property
+    def read_timeout(self):
+        return getattr(self.sends, "read_timeout", None)
+
+    async def initialize(self):
+        await self.sends.initialize()
+        await self.downloads.initialize()
+
+    async def shutdown(self):
+        await self.sends.shutdown()
+        await self.downloads.shutdown()
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        target = self.downloads if "/file/bot" in url else self.sends
+        return await target.do_request(url, method, request_data, **kwargs)
+
+
+def configure(builder):
+    """מחבר לבונה הבוט (ApplicationBuilder) את שלושת המאגרים"""
+    POOLS.clear()
+    polling = InstrumentedRequest("האזנה", TG_POLL_POOL_SIZE, TG_POLL_READ_TIMEOUT)
+    sends = InstrumentedRequest("שליחה", TG_SEND_POOL_SIZE, TG_SEND_READ_TIMEOUT, TG_SEND_WRITE_TIMEOUT)
+    downloads = InstrumentedRequest("הורדות", TG_DOWNLOAD_CONCURRENCY, TG_DOWNLOAD_READ_TIMEOUT)
+    print(f"🌐 מאגרי HTTP: האזנה {TG_POLL_POOL_SIZE}, שליחה {TG_SEND_POOL_SIZE}, הורדות {TG_DOWNLOAD_CONCURRENCY} (HTTP/{sends.http_version})")
+    return builder.get_updates_request(polling).request(SplitRequest(sends, downloads))
@@ -1,26 +1,43 @@
+from __future__ import annotations # ההערות (Update, ContextTypes) לא מחייבות ייבוא של telegram
+
+import time
+_PROCESS_STARTED = time.perf_counter()
+
 import os
 import json
-import subprocess
-import requests
 import base64
 from datetime import datetime, timedelta
-import pytz
 import asyncio
 import re
 from difflib import SequenceMatcher
-import wave
-import webrtcvad
-import time
 import random
-from telegram.ext import filters
-
-from telegram import Update
-from telegram.ext import ApplicationBuilder, MessageHandler, filters, ContextTypes, CommandHandler
-from google.cloud import texttospeech
-
+import shutil
+import io
+import weakref
+import cProfile
+import pstats
+import tracemalloc
+import unicodedata
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+# ⚡ ספריות כבדות (telegram, requests, Flask, Google TTS, webrtcvad, numpy) נטענות רק כשצריך –
+# כך ש-import main מהיר וללא תופעות לוואי (בדיקות, בנצ'מרקים, תהליכי עבודה)
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
+import state_store
+from media_tools import text_to_mp3, encode_for_upload, upload_mime_type
+from media_worker import run_media_job, shutdown_pool
+from routing import ROUTES, ROUTES_FILE, load_routes, route_for, get_route
+
+# 📁 קבצי JSON ישנים – משמשים רק למיגרציה החד-פעמית ל-SQLite (state_store.py)
 # 📁 קובץ לשמירת היסטוריית הודעות
 LAST_MESSAGES_FILE = "last_messages.json"
 MAX_HISTORY = 55
+# 🎞️ כמה מזהי מדיה (file_unique_id) לזכור לבדיקת כפילות
+MAX_MEDIA_HISTORY = int(os.getenv("MAX_MEDIA_HISTORY", "500"))
 
 # 📁 קובץ הגדרות סינון
 FILTERS_FILE = "filters.json"
@@ -30,10 +47,13 @@ WORD_BANNED = []
 ALLOWED_LINKS = []
 # ✅ חדש: רשימת מספרי טלפון מאושרים
 ALLOWED_PHONES = [] 
+# ✅ חדש: ביטויים שמסמנים מבזק דחוף – נשלח מיד, בלי להמתין לאיחוד מבזקים
+PRIORITY_PHRASES = []
 
 # ✅ תוספת חדשה: קובץ הגדרות החלפת מילים
 REPLACEMENTS_FILE = "replacements.json"
 WORD_REPLACEMENTS = {} # יכיל מילון, לדוגמה: {"ה": "השם"}
+REPLACEMENTS_PATTERN = None # ביטוי רגולרי אחד לכל המפתחות (נבנה ב-set_word_replacements)
 
 # ✅ חדש: ביטוי רגולרי לזיהוי מספרי טלפון
 # דוגמאות למה שנתפס: 050-1234567, 03 1234567, 1700-123456
@@ -45,162 +65,83 @@ FILTER_MAPPING = {
     "איסור-חזק": "STRICT_BANNED",
     "איסור-מילה": "WORD_BANNED",
     "קישורים": "ALLOWED_LINKS",
-    "מספרים-מאושרים": "ALLOWED_PHONES" # ✅ חדש
+    "מספרים-מאושרים": "ALLOWED_PHONES", # ✅ חדש
+    "דחוף": "PRIORITY_PHRASES"
 }
 
-def load_last_messages():
-    if not os.path.exists(LAST_MESSAGES_FILE):
-        return []
+def load_last_messages(route):
     try:
-        with open(LAST_MESSAGES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return state_store.get_recent_messages(MAX_HISTORY, route.name)
     except Exception as e:
         print(f"⚠️ שגיאה בטעינת היסטוריית הודעות: {e}")
         return []
 
-def save_last_messages(messages):
-    messages = messages[-MAX_HISTORY:]
+# ✅ חדש: הוספת הודעה בודדת להיסטוריה (במקום שכתוב כל הרשימה)
+def append_last_message(text, route, job_id=None):
     try:
-        with open(LAST_MESSAGES_FILE, "w", encoding="utf-8") as f:
-            json.dump(messages, f, ensure_ascii=False)
+        return state_store.append_message(text, MAX_HISTORY, route.name, job_id)
     except Exception as e:
         print(f"⚠️ שגיאה בשמירת היסטוריית הודעות: {e}")
+        return None
 
 # ⚙️ פונקציה לטעינת הגדרות הסינון
 def load_filters():
-    global BLOCKED_PHRASES, STRICT_BANNED, WORD_BANNED, ALLOWED_LINKS, ALLOWED_PHONES
-    
-    # הגדרות ברירת מחדל מלאות
-    default_data = {
-        "BLOCKED_PHRASES": [],
-        "STRICT_BANNED": [],
-        "WORD_BANNED": [],
-        "ALLOWED_LINKS": [],
-        "ALLOWED_PHONES": [] # ✅ חדש
-    }
-
-    if not os.path.exists(FILTERS_FILE):
-        # יצירת קובץ ברירת מחדל אם אינו קיים
-        with open(FILTERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(default_data, f, ensure_ascii=False, indent=4)
-        
-        # אם נוצר חדש, נשתמש בברירת המחדל
-        BLOCKED_PHRASES = default_data["BLOCKED_PHRASES"]
-        STRICT_BANNED = default_data["STRICT_BANNED"]
-        WORD_BANNED = default_data["WORD_BANNED"]
-        ALLOWED_LINKS = default_data["ALLOWED_LINKS"]
-        ALLOWED_PHONES = default_data["ALLOWED_PHONES"]
-        print("✅ נוצר קובץ הגדרות ברירת מחדל חדש.")
-        return default_data
+    global BLOCKED_PHRASES, STRICT_BANNED, WORD_BANNED, ALLOWED_LINKS, ALLOWED_PHONES, PRIORITY_PHRASES, ACTIVE_FILTERS
 
     try:
-        with open(FILTERS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # עדכון הרשימות הגלובליות תוך שימוש ב-default_data כמקור אם מפתח חסר
-        BLOCKED_PHRASES = sorted(data.get("BLOCKED_PHRASES", default_data["BLOCKED_PHRASES"]), key=len, reverse=True)
-        STRICT_BANNED = data.get("STRICT_BANNED", default_data["STRICT_BANNED"])
-        WORD_BANNED = data.get("WORD_BANNED", default_data["WORD_BANNED"])
-        ALLOWED_LINKS = data.get("ALLOWED_LINKS", default_data["ALLOWED_LINKS"])
-        ALLOWED_PHONES = data.get("ALLOWED_PHONES", default_data["ALLOWED_PHONES"]) # ✅ טעינה
-
-        print(f"✅ נטענו בהצלחה {len(BLOCKED_PHRASES)} ניקוי, {len(STRICT_BANNED)} פוסלים, {len(WORD_BANNED)} מילים, {len(ALLOWED_LINKS)} קישורים ו- {len(ALLOWED_PHONES)} מספרים מאושרים.")
+        data = state_store.get_filters(FILTER_MAPPING.values())
+
+        BLOCKED_PHRASES = sorted(data["BLOCKED_PHRASES"], key=len, reverse=True)
+        STRICT_BANNED = data["STRICT_BANNED"]
+        WORD_BANNED = data["WORD_BANNED"]
+        ALLOWED_LINKS = data["ALLOWED_LINKS"]
+        ALLOWED_PHONES = data["ALLOWED_PHONES"]
+        PRIORITY_PHRASES = data["PRIORITY_PHRASES"]
+        # הידור חד-פעמי של כל המסננים – במקום סריקה נפרדת לכל ביטוי בכל הודעה
+        ACTIVE_FILTERS = FilterSet(data)
+        FILTER_SETS.clear() # פרופילים של ערוצים אחרים יהודרו מחדש בהודעה הבאה שלהם
+
+        print(f"✅ נטענו בהצלחה {len(BLOCKED_PHRASES)} ניקוי, {len(STRICT_BANNED)} פוסלים, {len(WORD_BANNED)} מילים, {len(ALLOWED_LINKS)} קישורים, {len(ALLOWED_PHONES)} מספרים מאושרים ו- {len(PRIORITY_PHRASES)} ביטויי דחיפות.")
         return data
     except Exception as e:
-        print(f"❌ נכשל בטעינת קובץ הגדרות סינון: {e}")
+        print(f"❌ נכשל בטעינת הגדרות סינון: {e}")
         return None
 
-# ✅ חדש: פונקציה לשמירת הגדרות הסינון
-def save_filters(data):
-    try:
-        # לוודא שכל הרשימות נשמרות לפי המפתחות שלהן
-        filtered_data = {k: data.get(k, []) for k in FILTER_MAPPING.values()}
-        with open(FILTERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(filtered_data, f, ensure_ascii=False, indent=4)
-        print("✅ הגדרות הסינון נשמרו בהצלחה.")
-        return True
-    except Exception as e:
-        print(f"❌ שגיאה בשמירת הגדרות סינון: {e}")
-        return False
-
 # ✅ תוספת חדשה: פונקציה לטעינת החלפות מילים
 def load_replacements():
-    global WORD_REPLACEMENTS
-    default_data = {} # ברירת המחדל היא מילון ריק
-    
-    if not os.path.exists(REPLACEMENTS_FILE):
-        with open(REPLACEMENTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(default_data, f, ensure_ascii=False, indent=4)
-        WORD_REPLACEMENTS = default_data
-        print("✅ נוצר קובץ החלפות מילים חדש (ריק).")
-        return default_data
-    
     try:
-        with open(REPLACEMENTS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # לוודא שזה מילון
-        if not isinstance(data, dict):
-             raise Exception("הקובץ אינו מכיל מילון (אובייקט JSON)")
-        WORD_REPLACEMENTS = data
+        data = state_store.get_replacements()
+        set_word_replacements(data)
         print(f"✅ נטענו בהצלחה {len(WORD_REPLACEMENTS)} החלפות מילים.")
         return data
     except Exception as e:
-        print(f"❌ נכשל בטעינת קובץ החלפות: {e}. משתמש במילון ריק.")
-        WORD_REPLACEMENTS = default_data
-        return default_data
-
-# ✅ תוספת חדשה: פונקציה לשמירת החלפות מילים
-def save_replacements(data):
-    global WORD_REPLACEMENTS
-    if not isinstance(data, dict):
-        print("❌ שגיאה: ניסיון לשמור החלפות שאינן מילון.")
-        return False
-        
-    WORD_REPLACEMENTS = data # עדכון המשתנה הגלובלי
-    try:
-        with open(REPLACEMENTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        print("✅ החלפות המילים נשמרו בהצלחה.")
-        return True
-    except Exception as e:
-        print(f"❌ שגיאה בשמירת החלפות מילים: {e}")
-        return False
-
-# 🟡 כתיבת קובץ מפתח Google מ־BASE64
-key_b64 = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_B64")
-if not key_b64:
-    raise Exception("❌ משתנה GOOGLE_APPLICATION_CREDENTIALS_B64 לא מוגדר או ריק")
+        print(f"❌ נכשל בטעינת החלפות: {e}. משתמש במילון ריק.")
+        set_word_replacements({})
+        return {}
 
-try:
-    with open("google_key.json", "wb") as f:
-        f.write(base64.b64decode(key_b64))
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "google_key.json"
-except Exception as e:
-    raise Exception("❌ נכשל בכתיבת קובץ JSON מ־BASE64: " + str(e))
+# ✅ חדש: עדכון מילון ההחלפות בזיכרון והידור מחדש של הביטוי הרגולרי
+def set_word_replacements(data):
+    global WORD_REPLACEMENTS, REPLACEMENTS_PATTERN
+    WORD_REPLACEMENTS = data
+    REPLACEMENTS_PATTERN = compile_replacements(data)
+    REPLACEMENT_SETS.clear()
 
 # 🛠 משתנים מ־Render וחדשים
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 YMOT_TOKEN = os.getenv("YMOT_TOKEN")
-YMOT_PATH = os.getenv("YMOT_PATH", "ivr2:90/")
+YMOT_PATH = os.getenv("YMOT_PATH", "ivr2:90/") # ברירת המחדל; ערוצים אחרים יכולים לקבל שלוחה משלהם (routes.json)
+# 📰 איחוד מבזקים (0 = כל מבזק נשלח בנפרד, כמו קודם)
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0"))         # שניות לאיסוף מבזקים
+COALESCE_MAX_ITEMS = int(os.getenv("COALESCE_MAX_ITEMS", "6"))     # שליחה מיידית כשמגיעים למספר הזה
+COALESCE_MAX_CHARS = int(os.getenv("COALESCE_MAX_CHARS", "1500"))  # או לאורך הזה (מגבלת TTS)
+# 📒 יומן משימות: כמה משימות שהסתיימו לשמור, וכמה פעמים לנסות להמשיך משימה שנקטעה
+JOURNAL_MAX_JOBS = int(os.getenv("JOURNAL_MAX_JOBS", "5000"))
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "3"))
+# 📂 תיקיית עבודה לקבצים זמניים – תיקייה נפרדת לכל הודעה
+WORK_DIR = os.getenv("WORK_DIR", "work")
 # ✅ חדש: מזהה משתמש אדמין לשליטה בפילטרים
 ADMIN_USER_ID = os.getenv("ADMIN_USER_ID") # מומלץ להגדיר כמשתנה סביבה!
 
-# טוען את הפילטרים מיד לאחר הגדרת המשתנים הגלובליים
-try:
-    filter_data = load_filters()
-except Exception as e:
-    print(e)
-    # אפשרות להמשיך עם רשימות ריקות אם הטעינה נכשלה, או לזרוק את השגיאה
-    pass
-
-# ✅ תוספת חדשה: טעינת החלפות המילים בהפעלה
-try:
-    replacements_data = load_replacements()
-except Exception as e:
-    print(e)
-    pass
-
-
 # 🔒 פונקציה לבדיקת הרשאת אדמין
 def is_admin(user_id):
     if not ADMIN_USER_ID:
@@ -238,7 +179,103 @@ def num_to_hebrew_words(hour, minute):
     hour_12 = hour % 12 or 12
     return f"{hours_map[hour_12]} {minutes_map[minute]}"
 
-def clean_text(text):
+# --- 🧾 שכבת טקסט מנורמל: כל הודעה נסרקת פעם אחת, וכל שלבי הסינון משתמשים בתוצאה ---
+
+# תווי כיווניות ותווים בלתי נראים שטלגרם משאיר בתוך הודעות בעברית ושוברים התאמות
+INVISIBLE_CHARS_REGEX = re.compile('[\u200b-\u200f\u202a-\u202e\u2066-\u2069\ufeff]')
+# קישור מפורש (http/https/www) – אלה נבדקים מול רשימת הקישורים המאושרים
+EXPLICIT_LINK_REGEX = re.compile(r'https?://\S+|www\.\S+')
+# כל מה שנראה כמו קישור או דומיין (example.com) – מוסר מהטקסט להקראה
+ANY_LINK_REGEX = re.compile(r'(?:https?://|www\.)\S+|\b[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\S*', re.IGNORECASE)
+WORD_REGEX = re.compile(r"\w+")
+
+def phone_digits(phone):
+    """מנרמל מספר טלפון לספרות בלבד: 050-1234567 ו-0501234567 הם אותו מספר"""
+    return re.sub(r'\D', '', phone)
+
+def _alternation(items, flags=0):
+    """ביטוי רגולרי אחד לכל הביטויים (מהארוך לקצר), או None אם הרשימה ריקה"""
+    items = [item for item in items if item]
+    if not items:
+        return None
+    return re.compile("|".join(re.escape(item) for item in sorted(items, key=len, reverse=True)), flags)
+
+class FilterSet:
+    """הגדרות הסינון במבנה מהודר: ביטוי רגולרי אחד לכל רשימה, וקבוצות (set) לחיפוש מילים ומספרים"""
+
+    def __init__(self, data):
+        self.strict_banned = list(data.get("STRICT_BANNED", []))
+        self.strict_regex = _alternation(self.strict_banned)
+        self.word_banned = list(data.get("WORD_BANNED", []))
+        self.word_banned_set = set(self.word_banned)
+        self.blocked_regex = _alternation(data.get("BLOCKED_PHRASES", []))
+        self.allowed_links = list(data.get("ALLOWED_LINKS", []))
+        self.allowed_phones = {phone_digits(p) for p in data.get("ALLOWED_PHONES", [])}
+        self.priority_phrases = list(data.get("PRIORITY_PHRASES", []))
+
+ACTIVE_FILTERS = FilterSet({})
+
+# 🧭 מסננים והחלפות לפי פרופילי הסינון של המסלול (routing.py).
+# כל צירוף פרופילים מהודר פעם אחת ומשותף לכל הערוצים שמשתמשים בו; פרופיל "default" בלבד = המסננים הגלובליים.
+FILTER_SETS = {}       # tuple(פרופילים) ← FilterSet
+REPLACEMENT_SETS = {}  # tuple(פרופילים) ← (מילון החלפות, ביטוי רגולרי)
+
+def filters_for(route):
+    if route.profiles == (state_store.DEFAULT_PROFILE,):
+        return ACTIVE_FILTERS
+    if route.profiles not in FILTER_SETS:
+        data = {key: [] for key in FILTER_MAPPING.values()}
+        for profile in route.profiles:
+            for key, items in state_store.get_filters(FILTER_MAPPING.values(), profile).items():
+                data[key].extend(item for item in items if item not in data[key])
+        FILTER_SETS[route.profiles] = FilterSet(data)
+        print(f"🧭 הודרו מסננים לפרופילים {'+'.join(route.profiles)}.")
+    return FILTER_SETS[route.profiles]
+
+def replacements_for(route):
+    if route.profiles == (state_store.DEFAULT_PROFILE,):
+        return WORD_REPLACEMENTS, REPLACEMENTS_PATTERN
+    if route.profiles not in REPLACEMENT_SETS:
+        merged = {}
+        for profile in route.profiles:
+            merged.update(state_store.get_replacements(profile)) # פרופיל מאוחר גובר
+        REPLACEMENT_SETS[route.profiles] = (merged, compile_replacements(merged))
+    return REPLACEMENT_SETS[route.profiles]
+
+class NormalizedMessage:
+    """טקסט ההודעה לאחר נרמול יוניקוד, עם המילים, המספרים והקישורים שזוהו בסריקה אחת"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        text = unicodedata.normalize("NFKC", raw)
+        self.text = INVISIBLE_CHARS_REGEX.sub('', text)
+        self.words = set(WORD_REGEX.findall(self.text))
+        # (התחלה, סוף, ספרות) לכל מספר טלפון
+        self.phones = [(m.start(), m.end(), phone_digits(m.group())) for m in PHONE_NUMBER_REGEX.finditer(self.text)]
+        # (התחלה, סוף) לכל קישור/דומיין
+        self.links = [m.span() for m in ANY_LINK_REGEX.finditer(self.text)]
+        self.has_explicit_link = EXPLICIT_LINK_REGEX.search(self.text) is not None
+
+def normalize_message(text):
+    return text if isinstance(text, NormalizedMessage) else NormalizedMessage(text)
+
+def _remove_spans(text, spans):
+    """מסיר מהטקסט את כל הקטעים שצוינו (גם חופפים) במעבר אחד"""
+    if not spans:
+        return text
+    parts = []
+    pos = 0
+    for start, end in sorted(spans):
+        if start > pos:
+            parts.append(text[pos:start])
+        pos = max(pos, end)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def clean_text(text, filters=None):
+    msg = normalize_message(text)
+    filters = filters or ACTIVE_FILTERS
+    text = msg.text
     add_moked_credit = False
 
     # בדיקה אם ההודעה מתחילה במילים 'חדשות המוקד'
@@ -246,61 +283,34 @@ def clean_text(text):
         add_moked_credit = True
         
     # --- ✅ בדיקה ראשונה: האם יש מספר טלפון? ---
-    global PHONE_NUMBER_REGEX, ALLOWED_PHONES
-    
-    # מציאת כל המספרים
-    found_phones = PHONE_NUMBER_REGEX.findall(text)
-    
-    if found_phones:
-        is_all_allowed = True
-        for phone in found_phones:
-            # בדיקה אם המספר שנמצא (בצורתו המקורית) אינו ברשימה המאושרת
-            if phone not in ALLOWED_PHONES:
-                is_all_allowed = False
-                break
-            
-        if not is_all_allowed:
-            print("⛔️ הודעה מכילה מספר טלפון לא מאושר – לא תועלה לשלוחה.")
-            return None, "⛔️ הודעה לא נשלחה: מכילה מספר טלפון לא מאושר."
-        
-        # --- 🟢 תוספת חדשה: הסרת מספרי טלפון מהטקסט להקראה 🟢 ---
-        # אם הגענו לכאן, כל מספרי הטלפון שנמצאו (אם היו) הם מאושרים,
-        # ולכן יש להסירם מהטקסט המיועד להקראה (TTS).
-        text = PHONE_NUMBER_REGEX.sub('', text)
-        print("✅ הודעה מכילה מספרי טלפון, כולם מאושרים. מספרי הטלפון הוסרו מהטקסט המיועד להקראה. ממשיך בסינון.")
-        # --- 🟢 סוף תוספת חדשה 🟢 ---
-
-
-    # --- בדיקה עם רשימות הסינון הנטענות ---
-    global STRICT_BANNED, WORD_BANNED, BLOCKED_PHRASES # שימוש ברשימות הגלובליות
-
-    # קבוצה ראשונה – מחפשים בכל מקום (STRICT_BANNED)
-    for banned in STRICT_BANNED:
-        if banned in text:
+    # המספרים כבר זוהו ונורמלו לספרות בלבד, כך שכל צורת כתיבה של מספר מאושר עוברת
+    if msg.phones:
+        for _, _, digits in msg.phones:
+            if digits not in filters.allowed_phones:
+                print("⛔️ הודעה מכילה מספר טלפון לא מאושר – לא תועלה לשלוחה.")
+                return None, "⛔️ הודעה לא נשלחה: מכילה מספר טלפון לא מאושר."
+        print("✅ הודעה מכילה מספרי טלפון, כולם מאושרים. מספרי הטלפון יוסרו מהטקסט המיועד להקראה. ממשיך בסינון.")
+
+    # קבוצה ראשונה – מחפשים בכל מקום (STRICT_BANNED), ביטוי רגולרי אחד לכל הרשימה
+    if filters.strict_regex:
+        match = filters.strict_regex.search(text)
+        if match:
+            banned = match.group()
             print(f"⛔️ הודעה מכילה מילה אסורה ('{banned}') – לא תועלה לשלוחה.")
             return None, f"⛔️ הודעה לא נשלחה: מכילה מילה אסורה ('{banned}')."
 
-    # קבוצה שנייה – מחפשים רק מילה שלמה (WORD_BANNED)
-    words = re.findall(r"\b\w+\b", text)
-    for banned in WORD_BANNED:
-        if banned in words:
-            print(f"⛔️ הודעה מכילה מילה אסורה ('{banned}') – לא תועלה לשלוחה.")
-            return None, f"⛔️ הודעה לא נשלחה: מכילה מילה אסורה ('{banned}')."
+    # קבוצה שנייה – מחפשים רק מילה שלמה (WORD_BANNED), חיתוך קבוצות מול מילות ההודעה
+    if filters.word_banned_set & msg.words:
+        banned = next(word for word in filters.word_banned if word in msg.words)
+        print(f"⛔️ הודעה מכילה מילה אסורה ('{banned}') – לא תועלה לשלוחה.")
+        return None, f"⛔️ הודעה לא נשלחה: מכילה מילה אסורה ('{banned}')."
 
-    # --- ניקוי ביטויים (BLOCKED_PHRASES) ---
-    for phrase in BLOCKED_PHRASES:
-        text = text.replace(phrase, '')
-        
-    # --- 🟢🟢🟢 תיקון הקישורים כאן 🟢🟢🟢 ---
-    # מחליף את שתי השורות הישנות בשורה אחת חזקה יותר
-    # השורות הישנות היו:
-    # text = re.sub(r'https?://\S+', '', text)
-    # text = re.sub(r'www\.\S+', '', text)
-    
-    # שורה מתוקנת שמסירה http, https, www, וגם דומיינים כמו example.com
-    # זה מונע הקראה של קישורים מאושרים שעברו את הבדיקה
-    text = re.sub(r'(?:https?://|www\.)\S+|\b[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\S*', '', text, flags=re.IGNORECASE)
-    # --- 🟢🟢🟢 סוף התיקון 🟢🟢🟢 ---
+    # --- ניקוי: מספרי טלפון (מאושרים), ביטויים חסומים (BLOCKED_PHRASES) וקישורים – במעבר אחד ---
+    # הקישורים מוסרים כדי למנוע הקראה של קישורים מאושרים שעברו את הבדיקה
+    spans = [(start, end) for start, end, _ in msg.phones] + msg.links
+    if filters.blocked_regex:
+        spans += [m.span() for m in filters.blocked_regex.finditer(text)]
+    text = _remove_spans(text, spans)
 
     text = re.sub(r'[^\w\s.,!?()\u0590-\u05FF]', '', text)
     text = re.sub(r'\s+', ' ', text).strip()
@@ -311,26 +321,26 @@ def clean_text(text):
 
     return text, None
 
+# ✅ חדש: ביטוי רגולרי אחד לכל מפתחות ההחלפה (מהארוך לקצר), עם גבולות מילה
+def compile_replacements(replacements_map):
+    if not replacements_map:
+        return None
+    keys = sorted(replacements_map.keys(), key=len, reverse=True)
+    return re.compile(r'\b(?:' + "|".join(re.escape(key) for key in keys) + r')\b')
+
 # ✅ תוספת חדשה: פונקציה להחלת החלפות מילים
-def apply_replacements(text, replacements_map):
+def apply_replacements(text, replacements_map, pattern=None):
     """
     מחליף מילים בטקסט לפי מילון, תוך שימוש בגבולות מילה (\b).
-    ממיין מפתחות מהארוך לקצר למניעת החלפות חלקיות.
+    כל המפתחות מאוחדים לביטוי אחד (מהארוך לקצר) ומוחלפים במעבר יחיד על הטקסט.
     """
     if not replacements_map:
         return text
 
-    # מיון לפי אורך המפתח, מהארוך לקצר (למשל, כדי ש"ב"ה" יוחלף לפני "ה")
     try:
-        sorted_keys = sorted(replacements_map.keys(), key=len, reverse=True)
-        
-        for key in sorted_keys:
-            value = replacements_map[key]
-            # שימוש ב-re.escape כדי לטפל בתווים מיוחדים במפתח (כמו נקודות)
-            # שימוש ב-\b כדי להבטיח החלפה של מילה שלמה בלבד
-            pattern = r'\b' + re.escape(key) + r'\b'
-            text = re.sub(pattern, value, text)
-            
+        if pattern is None:
+            pattern = compile_replacements(replacements_map)
+        text = pattern.sub(lambda m: replacements_map[m.group()], text)
     except Exception as e:
         print(f"⚠️ שגיאה בהחלת החלפות מילים: {e}")
         # ממשיך עם הטקסט כפי שהוא
@@ -339,84 +349,24 @@ def apply_replacements(text, replacements_map):
 
 
 def create_full_text(text):
+    import pytz
     tz = pytz.timezone('Asia/Jerusalem')
     now = datetime.now(tz)
     hebrew_time = num_to_hebrew_words(now.hour, now.minute)
     return f"{hebrew_time} במבזקים-פלוס. {text}"
 
-def text_to_mp3(text, filename='output.mp3'):
-    client = texttospeech.TextToSpeechClient()
-    synthesis_input = texttospeech.SynthesisInput(text=text)
-    voice = texttospeech.VoiceSelectionParams(
-        language_code="he-IL",
-        name="he-IL-Wavenet-B",
-        ssml_gender=texttospeech.SsmlVoiceGender.MALE
-    )
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3,
-        speaking_rate=1.2
-    )
-    response = client.synthesize_speech(
-        input=synthesis_input, voice=voice, audio_config=audio_config
-    )
-    with open(filename, "wb") as out:
-        out.write(response.audio_content)
-
-def convert_to_wav(input_file, output_file='output.wav'):
-    subprocess.run([
-        'ffmpeg', '-i', input_file, '-ar', '8000', '-ac', '1', '-f', 'wav',
-        output_file, '-y'
-    ])
-
-def has_audio_track(file_path):
-    """בודק אם יש ערוץ שמע בקובץ וידאו"""
-    try:
-        result = subprocess.run(
-            ['ffprobe', '-i', file_path, '-show_streams', '-select_streams', 'a', '-loglevel', 'error'],
-            capture_output=True, text=True
-        )
-        return bool(result.stdout.strip())
-    except Exception as e:
-        print("⚠️ שגיאה בבדיקת ffprobe:", e)
-        return False
-
-# ✅ תוספת: בדיקה אם קובץ WAV מכיל דיבור אנושי
-def contains_human_speech(wav_path, frame_duration=30):
-    try:
-        vad = webrtcvad.Vad(1)
-        with wave.open(wav_path, 'rb') as wf:
-            # בדיקת פורמט קובץ, אם לא 8k/16k מונו 16bit, המר
-            if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() not in [8000, 16000]:
-                convert_to_wav(wav_path, 'temp.wav')
-                wf = wave.open('temp.wav', 'rb')
-            frames = wf.readframes(wf.getnframes())
-            frame_size = int(wf.getframerate() * frame_duration / 1000) * 2
-            speech_detected = False
-            for i in range(0, len(frames), frame_size):
-                frame = frames[i:i+frame_size]
-                if len(frame) < frame_size:
-                    break
-                if vad.is_speech(frame, wf.getframerate()):
-                    speech_detected = True
-                    break
-            if os.path.exists('temp.wav'):
-                os.remove('temp.wav')
-            return speech_detected
-    except Exception as e:
-        print("⚠️ שגיאה בבדיקת דיבור אנושי:", e)
-        return False
-
 # ⚠️ הפונקציה עודכנה ללוג מפורט יותר!
-def upload_to_ymot(wav_file_path):
+def upload_to_ymot(wav_file_path, ymot_path=None):
     # ✅ ✅ ✅ התיקון הקריטי כאן: הוספנו את הנקודה הדרושה (.co.il)
+    import requests
     url = 'https://call2all.co.il/ym/api/UploadFile' 
     for i in range(5):
         try:
             with open(wav_file_path, 'rb') as f:
-                files = {'file': (os.path.basename(wav_file_path), f, 'audio/wav')}
+                files = {'file': (os.path.basename(wav_file_path), f, upload_mime_type(wav_file_path))}
                 data = {
                     'token': YMOT_TOKEN,
-                    'path': YMOT_PATH,
+                    'path': ymot_path or YMOT_PATH,
                     'convertAudio': '1',
                     'autoNumbering': 'true'
                 }
@@ -467,6 +417,7 @@ async def safe_send(bot, chat_id, text, **kwargs):
 
 # ✅ פונקציה שבודקת אם עכשיו שבת או חג
 async def is_shabbat_or_yom_tov():
+    import requests
     try:
         url = "https://www.hebcal.com/zmanim?cfg=json&im=1&geonameid=293397"
         res = await asyncio.to_thread(requests.get, url, timeout=10)
@@ -483,17 +434,223 @@ async def is_shabbat_or_yom_tov():
         print(f"⚠️ שגיאה בבדיקת שבת/חג: {e}")
         return False
 
+# 🗣️ הקראת טקסט (TTS) וקידוד להעלאה – קריאה חוסמת, רצה בחוט נפרד
+def synthesize_text(text_body, work_dir, route):
+    os.makedirs(work_dir, exist_ok=True)
+    full_text = create_full_text(text_body)
+    tts_path = os.path.join(work_dir, "tts.mp3")
+    text_to_mp3(full_text, tts_path, route.voice, route.speaking_rate)
+    return encode_for_upload(tts_path, os.path.join(work_dir, "output"))
+
+# 📤 העלאת קובץ שכבר הוקרא (בתור ההעלאות של המסלול), וסימון כל המשימות שבו כהושלמו
+async def upload_synthesized(job_ids, upload_file, work_dir, route):
+    async with route.slot("upload"):
+        upload_result = await asyncio.to_thread(upload_to_ymot, upload_file, route.ymot_path)
+    stage = "failed" if upload_result.startswith("❌") else "done"
+    for job_id in job_ids:
+        state_store.update_job(job_id, stage)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+async def publish_bulletin(job_ids, texts, route, bot):
+    work_dir = os.path.join(WORK_DIR, f"tts-{job_ids[0]}")
+    bulletin = texts[0] if len(texts) == 1 else ". ".join(item.rstrip(" .") for item in texts)
+    try:
+        async with route.slot("tts"):
+            upload_file = await asyncio.to_thread(synthesize_text, bulletin, work_dir, route)
+    except Exception as e:
+        # TTS / קידוד נכשלו – המשימות לא יישארו תקועות עד ההפעלה הבאה, והערוץ יקבל הודעה
+        print(f"❌ שגיאה בהקראת מבזק ({len(job_ids)} עדכונים): {e}")
+        chat_ids = set()
+        for job_id in job_ids:
+            job = state_store.get_job(job_id)
+            if job and job["payload"].get("chat_id") is not None:
+                chat_ids.add(job["payload"]["chat_id"])
+            state_store.update_job(job_id, "failed")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        for chat_id in chat_ids:
+            await safe_send(bot, chat_id, "❌ הודעה לא נשלחה: שגיאה בהקראת הטקסט (TTS).")
+        return
+    # 📒 התוצר נשמר ביומן – אחרי הפעלה מחדש רק ההעלאה תתבצע שוב, בלי TTS
+    for job_id in job_ids:
+        state_store.update_job(job_id, "synthesized", artifacts={"upload_file": upload_file, "bulletin": job_ids})
+    await upload_synthesized(job_ids, upload_file, work_dir, route)
+
+# 📰 איחוד מבזקים: בזמן פרץ של עדכונים קצרים אוספים אותם לחלון זמן קצר
+# ומקריאים אותם כמבזק אחד – הודעת שעה אחת, קריאת TTS אחת והעלאה אחת.
+# התור, הטיימר והמנעול שמורים לכל מסלול בנפרד (Route.pending_bulletin) – מבזקים לשלוחות שונות לא מתערבבים.
+async def publish_text(job_id, cleaned_text, priority, route, bot):
+    if COALESCE_WINDOW <= 0:
+        print(f"✅ מעלה טקסט (TTS) בלבד (עם החלפות) לשלוחה {route.ymot_path}.")
+        await publish_bulletin([job_id], [cleaned_text], route, bot)
+        return
+
+    pending = route.pending_bulletin
+    # עדכון שיחרוג מ-COALESCE_MAX_CHARS – קודם שולחים את מה שכבר ממתין (מגבלת הגודל של ה-TTS)
+    overflow = []
+    if pending and sum(len(item) for _, item in pending) + len(cleaned_text) > COALESCE_MAX_CHARS:
+        overflow = _take_pending(route)
+
+    pending.append((job_id, cleaned_text))
+    state_store.update_job(job_id, "queued")
+    print(f"📰 מבזק נוסף לאיחוד של {route.name} ({len(pending)} ממתינים).")
+
+    if overflow:
+        print(f"✅ מבזק מאוחד הגיע למגבלת האורך – שולח {len(overflow)} עדכונים קודמים.")
+        await _publish_pending(route, bot, overflow)
+
+    pending_chars = sum(len(item) for _, item in pending)
+    if priority or len(pending) >= COALESCE_MAX_ITEMS or pending_chars >= COALESCE_MAX_CHARS:
+        if priority:
+            print("🚨 מבזק דחוף – שולח מיד.")
+        await flush_bulletin(route, bot)
+    elif pending and route.bulletin_timer is None:
+        route.bulletin_timer = asyncio.create_task(_flush_bulletin_later(route, bot))
+
+async def _flush_bulletin_later(route, bot):
+    await asyncio.sleep(COALESCE_WINDOW)
+    route.bulletin_timer = None
+    await flush_bulletin(route, bot)
+
+def _take_pending(route):
+    """מוציא את כל הממתינים מהתור (בלי המתנה – כך שסדר ההגעה נשמר) ומבטל את הטיימר"""
+    if route.bulletin_timer is not None and route.bulletin_timer is not asyncio.current_task():
+        route.bulletin_timer.cancel()
+    route.bulletin_timer = None
+    items = route.pending_bulletin[:]
+    route.pending_bulletin.clear()
+    return items
+
+async def _publish_pending(route, bot, items):
+    if not items:
+        return
+    async with route.bulletin_lock:
+        print(f"✅ מעלה מבזק מאוחד של {len(items)} עדכונים ל-{route.name} (TTS אחד, העלאה אחת).")
+        await publish_bulletin([job_id for job_id, _ in items], [text for _, text in items], route, bot)
+
+async def flush_bulletin(route, bot):
+    await _publish_pending(route, bot, _take_pending(route))
+
+# 🎬 עיבוד הודעת וידאו/אודיו: הורדה, שליחת משימה לתהליך עבודה, העלאה וניקוי
+# כל שלב נרשם ביומן המשימות, כך שאחרי הפעלה מחדש ממשיכים מהשלב האחרון שהושלם
+async def process_media_post(bot, job_id, payload, artifacts):
+    work_dir = os.path.join(WORK_DIR, str(job_id))
+    os.makedirs(work_dir, exist_ok=True)
+    kind = payload["kind"]
+    route = get_route(payload.get("route"))
+
+    def finish(stage):
+        state_store.update_job(job_id, stage)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    try:
+        # ⏳ התקציב של המסלול: הורדה ועיבוד, ואחר כך תור ההעלאות לשלוחה
+        async with route.slot("processing"):
+            output_path = artifacts.get("output")
+            fingerprinted = artifacts.get("fingerprinted", False)
+            input_path = artifacts.get("input")
+            input_bytes = None
+            if not (output_path and os.path.exists(output_path)) and not (input_path and os.path.exists(input_path)):
+                media_file = await bot.get_file(payload["file_id"])
+                if kind == "video":
+                    print("✅ מוריד וידאו לעיבוד.")
+                    input_path = os.path.join(work_dir, "video.mp4")
+                    await media_file.download_to_drive(input_path)
+                    state_store.update_job(job_id, "downloaded", artifacts={"input": input_path})
+                else:
+                    # 🎧 הודעה קולית/אודיו: הורדה לזיכרון ופענוח בלי דיסק (אחרי נפילה פשוט מורידים שוב)
+                    print("✅ מעלה קובץ אודיו/הקלטה קולית.")
+                    input_bytes = bytes(await media_file.download_as_bytearray())
+
+            if not (output_path and os.path.exists(output_path)):
+                cleaned_text = payload.get("cleaned_text")
+                job = {
+                    "job_id": str(job_id),
+                    "kind": kind,
+                    "input": input_path,
+                    "input_bytes": input_bytes,
+                    # אם יש טקסט שעבר סינון, כפילות והחלפה – הוא יוקרא לפני שמע הוידאו
+                    "tts_text": create_full_text(cleaned_text) if kind == "video" and cleaned_text else None,
+                    "work_dir": work_dir,
+                    "route": route.name,
+                    "voice": route.voice,
+                    "speaking_rate": route.speaking_rate,
+                }
+                result = await run_media_job(job)
+                print(f"🧵 משימה {job_id} ({kind}) הסתיימה בתהליך {result['worker_pid']}: {result['status']} ({result['elapsed']:.1f} שניות)")
+                if result.get("trim"):
+                    trim = result["trim"]
+                    print(f"✂️ משימה {job_id}: נחתכו {trim['trimmed_seconds']:.1f} שניות שקט, נחסכו {trim['bytes_saved'] / 1024:.0f}KB, הגברה {trim['gain_db']:+.1f}dB")
+
+                if result["status"] != "ok":
+                    # --- 🛠️ מחיקת הטקסט מהזיכרון אם הוידאו נכשל 🛠️ ---
+                    if payload.get("history_id") is not None:
+                        state_store.remove_message(payload["history_id"])
+                    if result["status"] == "error":
+                        # שגיאת עיבוד (לא כפילות) – מאפשרים לנסות שוב את אותה מדיה
+                        state_store.release_media(payload["file_unique_id"], route.name)
+                    print(result["reason"])
+                    await safe_send(bot, payload["chat_id"], result["reason"])
+                    finish("rejected" if result["status"] == "rejected" else "failed")
+                    return
+
+                output_path, fingerprinted = result["output"], result["fingerprinted"]
+                state_store.update_job(job_id, "processed", artifacts={"output": output_path, "fingerprinted": fingerprinted})
+
+        async with route.slot("upload"):
+            upload_result = await asyncio.to_thread(upload_to_ymot, output_path, route.ymot_path)
+        if upload_result.startswith("❌"):
+            # ההעלאה נכשלה – משחררים את רישומי הכפילות כדי שעותק הבא לא ייחסם
+            state_store.release_media(payload["file_unique_id"], route.name)
+            if fingerprinted:
+                state_store.release_fingerprint(str(job_id))
+            finish("failed")
+            return
+        finish("done")
+    except Exception:
+        # שגיאה בהורדה/בעיבוד – מאפשרים לנסות שוב את אותה מדיה
+        state_store.release_media(payload["file_unique_id"], route.name)
+        finish("failed")
+        raise
+
 # ⬇️ ⬇️ עכשיו אפשר להשתמש בה כאן בתוך handle_message ⬇️ ⬇️
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.channel_post
     if not message:
         return
 
+    # 📒 אידמפוטנטיות: update_id שכבר נקלט (הושלם או ממתין להמשך) לא יעובד שוב
+    if not state_store.begin_job(update.update_id, {"update": update.to_dict()}, JOURNAL_MAX_JOBS):
+        print(f"⏩ עדכון {update.update_id} כבר טופל – מדלג.")
+        return
+
+    await run_channel_post(update, context.bot, context.application)
+
+async def run_channel_post(update, bot, application):
+    await process_channel_post(update, bot, application)
+    # הודעה שלא עברה לשלב הבא נפסלה באחד המסננים (שבת, קישור, מילה אסורה, כפילות...)
+    job = state_store.get_job(update.update_id)
+    if job and job["stage"] == "received":
+        state_store.update_job(update.update_id, "rejected")
+
+    # 🔬 ספירת הודעות עבור /profile במצב "הודעות" (לא עושה כלום כשאין פרופיילינג פעיל)
+    if _profile_state is not None:
+        _profile_state["messages"] += 1
+        if _profile_state["messages"] >= _profile_state["target_messages"]:
+            _profile_state["done"].set()
+
+async def process_channel_post(update, bot, application):
+    message = update.channel_post
+    job_id = update.update_id
+
     # ✅ תוספת – עצירה אוטומטית בשבתות וחגים
     if await is_shabbat_or_yom_tov():
         print("📵 שבת/חג – דילוג על ההודעה")
         return
 
+    # 🧭 המסלול של ערוץ המקור: שלוחה, קול, פרופיל סינון ותקציב מקביליות
+    route = route_for(message.chat_id)
+    filters = filters_for(route)
+
     text = message.text or message.caption
     has_video = message.video is not None
     has_audio = message.audio is not None or message.voice is not None
@@ -501,13 +658,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # ❌ הסרנו את הדגל הישן text_already_uploaded = False
 
     async def send_error_to_channel(reason):
-        if context.bot:
+        if bot:
             # שימוש ב-safe_send
-            await safe_send(context.bot, message.chat_id, reason) 
+            await safe_send(bot, message.chat_id, reason) 
 
-    global ALLOWED_LINKS # שימוש ברשימה הגלובלית שנטענה
-    if text and any(re.search(r'https?://\S+|www\.\S+', part) for part in text.split()):
-        if not any(link in text for link in ALLOWED_LINKS):
+    # 🧾 נרמול וסריקה אחת של ההודעה – כל השלבים הבאים משתמשים בתוצאה
+    msg = normalize_message(text) if text else None
+
+    if msg and msg.has_explicit_link:
+        if not any(link in msg.text for link in filters.allowed_links):
             reason = "⛔️ הודעה לא נשלחה: קישור לא מאושר."
             print(reason)
             await send_error_to_channel(reason)
@@ -515,8 +674,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
     # ✅ ✅ ✅ לוגיקה חדשה: טיפול בטקסט (סינון וכפילות) פעם אחת בלבד
     cleaned_text = None
+    history_id = None # מזהה הרשומה בהיסטוריה, למחיקה אם המדיה תיפסל
     if text:
-        cleaned, reason = clean_text(text)
+        cleaned, reason = clean_text(msg, filters)
         
         if cleaned is None: # נכשל בסינון (מילה אסורה/טלפון לא מאושר)
             if reason:
@@ -530,9 +690,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # --- בדיקת כפילות (הדבר שרצית להוסיף) ---
-        last_messages = load_last_messages()
+        last_messages = load_last_messages(route)
+        matcher = SequenceMatcher(None, cleaned)
         for previous in last_messages:
-            similarity = SequenceMatcher(None, cleaned, previous).ratio()
+            matcher.set_seq2(previous)
+            # real_quick_ratio / quick_ratio הם חסמים עליונים זולים – מדלגים על ratio המלא כשאין סיכוי
+            if matcher.real_quick_ratio() < 0.55 or matcher.quick_ratio() < 0.55:
+                continue
+            similarity = matcher.ratio()
             # 0.55 הוא סף סביר לכפילות, כפי שהוגדר בקוד המקורי שלך
             if similarity >= 0.55:
                 reason = f"⏩ הודעה דומה מדי להודעה קודמת ({similarity*100:.1f}%) – לא תועלה לשלוחה."
@@ -542,107 +707,96 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # אם עבר את כל הבדיקות, הטקסט מוכן ונוסיף אותו להיסטוריה
         # זה מונע כפילות גם כשיש מדיה וגם כשיש טקסט בלבד
-        last_messages.append(cleaned)
-        save_last_messages(last_messages)
+        history_id = append_last_message(cleaned, route, job_id)
         
         # ✅ תוספת חדשה: החלת החלפות מילים
         # עושים זאת *אחרי* בדיקת הכפילות, אבל *לפני* השליחה ל-TTS
-        global WORD_REPLACEMENTS
-        if WORD_REPLACEMENTS:
-            print(f"🔍 מחיל {len(WORD_REPLACEMENTS)} החלפות מילים...")
-            cleaned_text = apply_replacements(cleaned, WORD_REPLACEMENTS)
+        replacements, replacements_pattern = replacements_for(route)
+        if replacements:
+            print(f"🔍 מחיל {len(replacements)} החלפות מילים...")
+            cleaned_text = apply_replacements(cleaned, replacements, replacements_pattern)
         else:
             cleaned_text = cleaned
         # ---------------------------------------------
         
-    # 2. טיפול בוידאו (אם יש)
-    if has_video:
-        video_file = await message.video.get_file()
-        await video_file.download_to_drive("video.mp4")
-
-        # 2א. בדיקת שמע בוידאו
-        if not has_audio_track("video.mp4"):
-            reason = "⛔️ הודעה לא נשלחה: וידאו ללא שמע."
-            
-            # --- 🛠️ התיקון: מחיקת הטקסט מהזיכרון אם הוידאו נכשל 🛠️ ---
-            if cleaned_text:
-                last_messages = load_last_messages()
-                if last_messages and last_messages[-1] == cleaned_text:
-                    last_messages.pop()  # מוחק את ההודעה האחרונה
-                    save_last_messages(last_messages)
-            # -----------------------------------------------------------
-
-            print(reason)
-            await send_error_to_channel(reason)
-            os.remove("video.mp4")
-            return
-
-        convert_to_wav("video.mp4", "video.wav")
-
-        # 2ב. בדיקת דיבור אנושי
-        if not contains_human_speech("video.wav"):
-            reason = "⛔️ הודעה לא נשלחה: שמע אינו דיבור אנושי."
-            
-            # --- 🛠️ התיקון: מחיקת הטקסט מהזיכרון אם הוידאו נכשל 🛠️ ---
-            if cleaned_text:
-                last_messages = load_last_messages()
-                if last_messages and last_messages[-1] == cleaned_text:
-                    last_messages.pop()  # מוחק את ההודעה האחרונה
-                    save_last_messages(last_messages)
-            # -----------------------------------------------------------
-
+    # 2+3. טיפול בוידאו / אודיו (אם יש) – העיבוד הכבד רץ בתהליכי העבודה (media_worker.py)
+    if has_video or has_audio:
+        # ✅ בדיקת כפילות מדיה זולה לפני ההורדה: אותו קובץ שהועבר מכמה ערוצים
+        media = message.video or message.audio or message.voice
+        if not state_store.claim_media(media.file_unique_id, MAX_MEDIA_HISTORY, route.name, job_id):
+            reason = "⏩ מדיה זהה כבר הועלתה לשלוחה – לא תועלה שוב."
+            if history_id is not None:
+                state_store.remove_message(history_id)
             print(reason)
             await send_error_to_channel(reason)
-            os.remove("video.mp4")
-            os.remove("video.wav")
             return
 
-        # 2ג. יצירת קובץ אודיו סופי לשלוחה
-        if cleaned_text: # אם יש טקסט שעבר סינון, כפילות והחלפה, צרף אותו
-            print("✅ יוצר שמע מ-TTS (עם החלפות) ומצרף לשמע הוידאו.")
-            full_text = create_full_text(cleaned_text)
-            text_to_mp3(full_text, "text.mp3")
-            convert_to_wav("text.mp3", "text.wav")
-            # שרשור TTS + וידאו אודיו
-            subprocess.run(['ffmpeg', '-i', 'text.wav', '-i', 'video.wav', '-filter_complex',
-                            '[0:a][1:a]concat=n=2:v=0:a=1[out]', '-map', '[out]', 'media.wav', '-y'])
-            os.remove("text.mp3")
-            os.remove("text.wav")
-            os.remove("video.wav")
-        else: # אין טקסט/הטקסט היה ריק, השתמש רק בשמע הוידאו
-            print("✅ מעלה את שמע הוידאו בלבד.")
-            os.rename("video.wav", "media.wav")
-
-        # 2ד. העלאה וניקוי
-        upload_to_ymot("media.wav")
-        os.remove("video.mp4")
-        os.remove("media.wav")
-
-    # 3. טיפול באודיו (אם יש)
-    elif has_audio:
-        print("✅ מעלה קובץ אודיו/הקלטה קולית.")
-        audio_file = await (message.audio or message.voice).get_file()
-        await audio_file.download_to_drive("audio.ogg")
-        convert_to_wav("audio.ogg", "media.wav")
-        upload_to_ymot("media.wav")
-        os.remove("audio.ogg")
-        os.remove("media.wav")
+        payload = {
+            "kind": "video" if has_video else "audio",
+            "chat_id": message.chat_id,
+            "file_id": media.file_id,
+            "file_unique_id": media.file_unique_id,
+            "cleaned_text": cleaned_text,
+            "history_id": history_id,
+            "route": route.name,
+        }
+        state_store.update_job(job_id, "accepted", payload=payload)
+        # התהליך הראשי רק קולט ומסנן – המדיה מעובדת ברקע, בתקציב של המסלול
+        application.create_task(process_media_post(bot, job_id, payload, {}))
 
     # 4. טיפול בטקסט בלבד (אם יש טקסט ואין וידאו/אודיו)
     elif cleaned_text: # אם הגענו לכאן, זה טקסט בלבד שכבר עבר סינון, כפילות, היסטוריה והחלפה
-        print("✅ מעלה טקסט (TTS) בלבד (עם החלפות).")
-        full_text = create_full_text(cleaned_text)
-        text_to_mp3(full_text, "output.mp3")
-        convert_to_wav("output.mp3", "output.wav")
-        upload_to_ymot("output.wav")
-        os.remove("output.mp3")
-        os.remove("output.wav")
+        is_priority = any(phrase in msg.text for phrase in filters.priority_phrases)
+        state_store.update_job(job_id, "accepted", payload={
+            "kind": "text", "chat_id": message.chat_id, "cleaned_text": cleaned_text, "priority": is_priority,
+            "route": route.name
+        })
+        # ה-TTS וההעלאה רצים ברקע – מסלול איטי לא מעכב קליטה של הודעות מערוצים אחרים
+        application.create_task(publish_text(job_id, cleaned_text, is_priority, route, bot))
 
     # ❌ הקוד המקורי הוסר:
     # if text and not text_already_uploaded: # ✅ לא נשלח פעמיים
     #    cleaned, reason = clean_text(text)
     #    # ... כל לוגיקת הסינון והכפילות שהעברנו למעלה היתה כאן
 
+# ♻️ המשך משימות שלא הושלמו (נקרא בכל הפעלה של הבוט, כולל אחרי נפילה)
+async def resume_unfinished_jobs(application):
+    jobs = state_store.claim_unfinished_jobs()
+    if not jobs:
+        return
+    print(f"♻️ נמצאו {len(jobs)} משימות שלא הושלמו – ממשיך מהשלב האחרון.")
+    bot = application.bot
+    resumed_uploads = set()
+
+    for job in jobs:
+        job_id, stage, payload, artifacts = job["update_id"], job["stage"], job["payload"], job["artifacts"]
+        if job["attempts"] > JOURNAL_MAX_ATTEMPTS:
+            print(f"❌ משימה {job_id} נכשלה {JOURNAL_MAX_ATTEMPTS} פעמים – מוותר עליה.")
+            state_store.update_job(job_id, "failed")
+            continue
+
+        print(f"♻️ משימה {job_id}: ממשיך משלב '{stage}'.")
+        route = get_route(payload.get("route"))
+        if stage == "received":
+            # ההודעה לא עברה עדיין את המסננים – מריצים את כל הצנרת מחדש,
+            # אחרי מחיקת רישומי הכפילות שההרצה הקודמת הספיקה לשמור (אחרת ההודעה תיפסל ככפולה של עצמה)
+            state_store.release_job_claims(job_id)
+            from telegram import Update
+            update = Update.de_json(payload["update"], bot)
+            application.create_task(run_channel_post(update, bot, application))
+        elif payload.get("kind") in ("video", "audio"):
+            application.create_task(process_media_post(bot, job_id, payload, artifacts))
+        elif stage == "synthesized" and os.path.exists(artifacts.get("upload_file", "")):
+            # ה-TTS כבר נוצר – נשארה רק ההעלאה (פעם אחת לכל מבזק מאוחד)
+            upload_file = artifacts["upload_file"]
+            if upload_file not in resumed_uploads:
+                resumed_uploads.add(upload_file)
+                application.create_task(
+                    upload_synthesized(artifacts["bulletin"], upload_file, os.path.dirname(upload_file), route)
+                )
+        else:
+            application.create_task(publish_text(job_id, payload["cleaned_text"], payload.get("priority", False), route, bot))
+
 # 🛠️ פונקציה לבריחת תווים מיוחדים (Markdown V1)
 def escape_markdown_v1(text):
     """
@@ -689,6 +843,7 @@ async def list_filters_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # ✅ הוספת טיפ לפקודה החדשה
     response += "_לצפייה ברשימה מלאה, השתמש ב־_`/view_filter <שם_רשימה>`\n"
+    response += "_לייצוא כקובץ ולעדכון גורף:_ `/export_filters`, `/bulk`\n"
 
     await update.message.reply_text(response, parse_mode="Markdown")
 
@@ -791,29 +946,23 @@ async def add_filter_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     json_key = FILTER_MAPPING[list_name]
     
-    current_data = load_filters()
-    if not current_data:
-        await update.message.reply_text("⚠️ שגיאה בטעינת קובץ הסינון.")
+    # הוספת הפריט (עדכון נקודתי במאגר, ללא שכתוב כל הרשימות)
+    try:
+        added = state_store.add_filter_item(json_key, item_to_add)
+    except Exception as e:
+        print(f"❌ שגיאה בשמירת הגדרות סינון: {e}")
+        await update.message.reply_text("❌ שגיאה בשמירת הקובץ. הפריט לא נוסף.")
         return
 
-    # הוספת הפריט
-    items = current_data.get(json_key, [])
-    if item_to_add in items:
+    if not added:
         await update.message.reply_text(f"ℹ️ הפריט '{item_to_add}' כבר קיים ברשימה {list_name}.")
         return
 
-    items.append(item_to_add)
-    current_data[json_key] = items
-
-    # שמירה ועדכון גלובלי
-    if save_filters(current_data):
-        # טעינה מחדש של הגלובליות כדי שהבוט יתחיל להשתמש בהן מיד
-        load_filters() 
-        # ✅ בריחה בתוך הודעת האישור
-        escaped_item = escape_markdown_v1(item_to_add)
-        await update.message.reply_text(f"✅ הפריט '{escaped_item}' נוסף לרשימה *{list_name}* בהצלחה!", parse_mode="Markdown")
-    else:
-        await update.message.reply_text("❌ שגיאה בשמירת הקובץ. הפריט לא נוסף.")
+    # טעינה מחדש של הגלובליות כדי שהבוט יתחיל להשתמש בהן מיד
+    load_filters()
+    # ✅ בריחה בתוך הודעת האישור
+    escaped_item = escape_markdown_v1(item_to_add)
+    await update.message.reply_text(f"✅ הפריט '{escaped_item}' נוסף לרשימה *{list_name}* בהצלחה!", parse_mode="Markdown")
 
 
 # ➖ פקודת /remove_filter: הסרת פריט
@@ -845,30 +994,24 @@ async def remove_filter_command(update: Update, context: ContextTypes.DEFAULT_TY
 
     json_key = FILTER_MAPPING[list_name]
     
-    current_data = load_filters()
-    if not current_data:
-        await update.message.reply_text("⚠️ שגיאה בטעינת קובץ הסינון.")
+    # הסרת הפריט (עדכון נקודתי במאגר)
+    try:
+        removed = state_store.remove_filter_item(json_key, item_to_remove)
+    except Exception as e:
+        print(f"❌ שגיאה בשמירת הגדרות סינון: {e}")
+        await update.message.reply_text("❌ שגיאה בשמירת הקובץ. הפריט לא הוסר.")
         return
 
-    # הסרת הפריט
-    items = current_data.get(json_key, [])
-    if item_to_remove not in items:
+    if not removed:
         await update.message.reply_text(f"ℹ️ הפריט '{item_to_remove}' לא נמצא ברשימה {list_name}.")
         return
 
-    items.remove(item_to_remove)
-    current_data[json_key] = items
+    # טעינה מחדש של הגלובליות כדי שהבוט יתחיל להשתמש בהן מיד
+    load_filters()
+    # ✅ בריחה בתוך הודעת האישור
+    escaped_item = escape_markdown_v1(item_to_remove)
+    await update.message.reply_text(f"✅ הפריט '{escaped_item}' הוסר מהרשימה *{list_name}* בהצלחה!", parse_mode="Markdown")
 
-    # שמירה ועדכון גלובלי
-    if save_filters(current_data):
-        # טעינה מחדש של הגלובליות כדי שהבוט יתחיל להשתמש בהן מיד
-        load_filters() 
-        # ✅ בריחה בתוך הודעת האישור
-        escaped_item = escape_markdown_v1(item_to_remove)
-        await update.message.reply_text(f"✅ הפריט '{escaped_item}' הוסר מהרשימה *{list_name}* בהצלחה!", parse_mode="Markdown")
-    else:
-        await update.message.reply_text("❌ שגיאה בשמירת הקובץ. הפריט לא הוסר.")
-    
 # --- ✅ תוספת חדשה: פקודות לניהול החלפות מילים ---
 
 # 📜 פקודת /list_replacements: הצגת כל ההחלפות
@@ -918,11 +1061,15 @@ async def add_replacement_command(update: Update, context: ContextTypes.DEFAULT_
     key = context.args[0]
     value = " ".join(context.args[1:])
 
-    current_data = load_replacements()
-    current_data[key] = value
+    try:
+        state_store.set_replacement(key, value)
+        set_word_replacements({**WORD_REPLACEMENTS, key: value}) # עדכון המשתנה הגלובלי
+        saved = True
+    except Exception as e:
+        print(f"❌ שגיאה בשמירת החלפות מילים: {e}")
+        saved = False
 
-    if save_replacements(current_data):
-        # אין צורך בטעינה מחדש, save_replacements מעדכן את המשתנה הגלובלי
+    if saved:
         escaped_key = escape_markdown_v1(key)
         escaped_value = escape_markdown_v1(value)
         await update.message.reply_text(f"✅ החלפה נוספה/עודכנה:\n`{escaped_key}` ⬅️ `{escaped_value}`", parse_mode="Markdown")
@@ -950,52 +1097,594 @@ async def remove_replacement_command(update: Update, context: ContextTypes.DEFAU
         return
 
     # שמירת הערך שהוסר להצגה
-    removed_value = current_data.pop(key)
+    removed_value = current_data[key]
 
-    if save_replacements(current_data):
-        escaped_key = escape_markdown_v1(key)
-        escaped_value = escape_markdown_v1(removed_value)
-        await update.message.reply_text(f"✅ החלפה הוסרה:\n`{escaped_key}` (היה ⬅️ `{escaped_value}`)", parse_mode="Markdown")
-    else:
-        # אם השמירה נכשלה, נחזיר את הערך כדי למנוע חוסר עקביות
-        current_data[key] = removed_value
+    try:
+        state_store.remove_replacement(key)
+    except Exception as e:
+        print(f"❌ שגיאה בשמירת החלפות מילים: {e}")
         await update.message.reply_text("❌ שגיאה בשמירת הקובץ. ההסרה בוטלה.")
+        return
+
+    set_word_replacements({k: v for k, v in WORD_REPLACEMENTS.items() if k != key}) # עדכון המשתנה הגלובלי
+    escaped_key = escape_markdown_v1(key)
+    escaped_value = escape_markdown_v1(removed_value)
+    await update.message.reply_text(f"✅ החלפה הוסרה:\n`{escaped_key}` (היה ⬅️ `{escaped_value}`)", parse_mode="Markdown")
 
 # --- סוף תוספת חדשה ---
-    
-# ♻️ keep alive
-from keep_alive import keep_alive
-keep_alive()
 
-# ▶️ הפעלת הבוט
-app = ApplicationBuilder().token(BOT_TOKEN).build()
-app.add_handler(MessageHandler(filters.ChatType.CHANNEL, handle_message))
+# --- 📦 ייבוא/ייצוא גורף של פילטרים והחלפות ---
+# כל השינויים מוחלים בטרנזקציה אחת, ואחריה טעינה והידור מחדש פעם אחת בלבד.
+#
+# פורמט שורות (/bulk או קובץ txt), שורה לכל פעולה:
+#   + ניקוי ביטוי להסרה          (הוספה; גם בלי +)
+#   - איסור-מילה מילה            (הסרה)
+#   + החלפה קיצור החלפה מלאה     (הוספה/עדכון החלפה)
+#   - החלפה קיצור                (הסרת החלפה)
+# CSV: אותן עמודות – [פעולה,] רשימה, פריט[, החלפה]
+# JSON: {"filters": {רשימה: [...]}, "remove": {רשימה: [...]},
+#        "replacements": {קיצור: החלפה}, "remove_replacements": [...], "mode": "replace"} – זה גם פורמט הייצוא
+# הפעולות מוחלות לפי סדר הקלט (הוספה ואז הסרה של אותו פריט ← הפריט מוסר).
+# מצב סנכרון ("/bulk sync", הכיתוב sync, או "mode": "replace" ב-JSON): הקובץ הוא התוכן המלא של הרשימות שמופיעות בו –
+# מה שלא מופיע מוסר, ורק ההפרש מול המאגר מוחל.
+# פרופיל סינון (routing.py): "/bulk [sync] <פרופיל>" בשורה הראשונה, או כיתוב הקובץ; בלי – פרופיל default.
+# פרופיל חייב להיות קיים במאגר או מוגדר במסלול – שגיאת הקלדה לא יוצרת פרופיל חדש.
+
+REPLACEMENTS_LIST_NAME = "החלפה"
+BULK_MAX_BYTES = 1024 * 1024
+BULK_SUMMARY_SAMPLE = 10 # כמה פריטים להציג מכל סוג בסיכום
+BULK_SYNC_WORDS = ("sync", "replace", "סנכרון")
+
+def resolve_list_name(name):
+    """שם ידידותי או מפתח JSON ← מפתח הרשימה ("REPLACEMENTS" עבור החלפות), או None"""
+    if name in FILTER_MAPPING:
+        return FILTER_MAPPING[name]
+    if name in FILTER_MAPPING.values():
+        return name
+    if name in (REPLACEMENTS_LIST_NAME, "החלפות", state_store.REPLACEMENTS_LIST):
+        return state_store.REPLACEMENTS_LIST
+    return None
+
+def _new_bulk_changes():
+    # ops: (op, list_key, item, value) לפי סדר הקלט; lists: הרשימות שהקלט מתייחס אליהן (לסנכרון)
+    return {"ops": [], "lists": set(), "errors": [], "mode": None}
+
+def _add_bulk_op(changes, op, list_name, item, value=None, where=""):
+    list_key = resolve_list_name(list_name.strip())
+    item = item.strip()
+    if not list_key:
+        changes["errors"].append(f"{where}רשימה לא מוכרת: {list_name}")
+    elif not item:
+        changes["errors"].append(f"{where}פריט ריק")
+    elif list_key == state_store.REPLACEMENTS_LIST and op == "+" and (value is None or not value.strip()):
+        changes["errors"].append(f"{where}חסרה החלפה עבור '{item}'")
+    else:
+        if list_key == state_store.REPLACEMENTS_LIST and op == "+":
+            value = value.strip()
+        else:
+            value = None
+        changes["ops"].append((op, list_key, item, value))
+        changes["lists"].add(list_key)
+
+def parse_bulk_lines(text):
+    changes = _new_bulk_changes()
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        op = "+"
+        if line[0] in "+-":
+            op, line = line[0], line[1:].strip()
+        parts = line.split(maxsplit=1)
+        if len(parts) < 2:
+            changes["errors"].append(f"שורה {n}: חסר פריט")
+            continue
+        list_name, item = parts
+        value = None
+        if resolve_list_name(list_name) == state_store.REPLACEMENTS_LIST and op == "+":
+            item, _, value = item.partition(" ")
+        _add_bulk_op(changes, op, list_name, item, value, where=f"שורה {n}: ")
+    return changes
+
+def parse_bulk_csv(text):
+    import csv
+    changes = _new_bulk_changes()
+    for n, row in enumerate(csv.reader(io.StringIO(text)), 1):
+        row = [cell.strip() for cell in row]
+        if not any(row) or row[0].startswith("#") or row[0].lower() in ("op", "list"):
+            continue
+        op = "+"
+        if row[0] in ("+", "-"):
+            op, row = row[0], row[1:]
+        if len(row) < 2:
+            changes["errors"].append(f"שורה {n}: חסר פריט")
+            continue
+        _add_bulk_op(changes, op, row[0], row[1], row[2] if len(row) > 2 else None, where=f"שורה {n}: ")
+    return changes
+
+def parse_bulk_json(text):
+    changes = _new_bulk_changes()
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("קובץ JSON חייב להיות אובייקט")
+    mode = data.get("mode", "merge")
+    if mode not in ("merge", "replace"):
+        raise ValueError(f"mode לא מוכר: {mode} (merge או replace)")
+    changes["mode"] = mode
+    for section, kind in (("filters", dict), ("add", dict), ("remove", dict), ("replacements", dict), ("remove_replacements", list)):
+        if not isinstance(data.get(section) or kind(), kind):
+            raise ValueError(f"'{section}' חייב להיות {'אובייקט' if kind is dict else 'רשימה'}")
+    for section, op in (("filters", "+"), ("add", "+"), ("remove", "-")):
+        for list_name, items in (data.get(section) or {}).items():
+            # גם רשימה ריקה נחשבת – בסנכרון היא מתרוקנת
+            if resolve_list_name(list_name.strip()):
+                changes["lists"].add(resolve_list_name(list_name.strip()))
+            for item in items if isinstance(items, list) else [items]:
+                _add_bulk_op(changes, op, list_name, str(item), where=f"{section}: ")
+    if "replacements" in data or "remove_replacements" in data:
+        changes["lists"].add(state_store.REPLACEMENTS_LIST)
+    for key, value in (data.get("replacements") or {}).items():
+        _add_bulk_op(changes, "+", REPLACEMENTS_LIST_NAME, str(key), str(value), where="replacements: ")
+    for key in data.get("remove_replacements") or []:
+        _add_bulk_op(changes, "-", REPLACEMENTS_LIST_NAME, str(key), where="remove_replacements: ")
+    return changes
+
+def parse_bulk(text, filename=""):
+    """בוחר מפענח לפי סיומת הקובץ (json/csv, אחרת שורות)"""
+    filename = (filename or "").lower()
+    if filename.endswith(".json") or (not filename and text.lstrip().startswith("{")):
+        return parse_bulk_json(text)
+    if filename.endswith(".csv"):
+        return parse_bulk_csv(text)
+    return parse_bulk_lines(text)
+
+def format_bulk_summary(diff, changes, sync=False):
+    friendly = {v: k for k, v in FILTER_MAPPING.items()}
+
+    def sample(items, fmt):
+        lines = [f"  {fmt(i)}" for i in items[:BULK_SUMMARY_SAMPLE]]
+        if len(items) > BULK_SUMMARY_SAMPLE:
+            lines.append(f"  ... ועוד {len(items) - BULK_SUMMARY_SAMPLE}")
+        return lines
+
+    requested = len(changes["ops"])
+    applied = sum(len(v) for v in diff.values())
+    if sync:
+        names = [friendly.get(k, REPLACEMENTS_LIST_NAME if k == state_store.REPLACEMENTS_LIST else k) for k in sorted(changes["lists"])]
+        lines = [f"📦 סנכרון מלא: {applied} שינויים ב-{len(names)} רשימות ({', '.join(names)})."]
+    else:
+        lines = [f"📦 עדכון גורף: {applied} שינויים מתוך {requested} פעולות ({requested - applied} ללא שינוי)."]
+    sections = (
+        ("➕ פילטרים שנוספו", diff["filters_added"], lambda i: f"{friendly.get(i[0], i[0])}: {i[1]}"),
+        ("➖ פילטרים שהוסרו", diff["filters_removed"], lambda i: f"{friendly.get(i[0], i[0])}: {i[1]}"),
+        ("➕ החלפות שנוספו", diff["replacements_added"], lambda i: f"{i[0]} ⬅️ {i[1]}"),
+        ("✏️ החלפות שעודכנו", diff["replacements_updated"], lambda i: f"{i[0]} ⬅️ {i[1]}"),
+        ("➖ החלפות שהוסרו", diff["replacements_removed"], lambda i: i),
+    )
+    for title, items, fmt in sections:
+        if items:
+            lines.append(f"\n{title} ({len(items)}):")
+            lines.extend(sample(items, fmt))
+    if changes["errors"]:
+        lines.append(f"\n⚠️ שורות שדולגו ({len(changes['errors'])}):")
+        lines.extend(sample(changes["errors"], lambda e: e))
+    return "\n".join(lines)
+
+def known_profiles():
+    """פרופילים שיש להם פילטרים/החלפות במאגר, או שמסלול כלשהו מפנה אליהם"""
+    profiles = {state_store.DEFAULT_PROFILE, *state_store.get_profiles()}
+    for route in ROUTES.values():
+        profiles.update(route.profiles)
+    return profiles
+
+def parse_bulk_target(words):
+    """מילות הפקודה/הכיתוב ("[sync] [פרופיל]") ← (פרופיל, sync)"""
+    profile, sync = state_store.DEFAULT_PROFILE, False
+    for word in words:
+        if word.lower() in BULK_SYNC_WORDS:
+            sync = True
+        else:
+            profile = word
+    return profile, sync
+
+async def _check_profile(update, profile):
+    if profile in known_profiles():
+        return True
+    await update.message.reply_text(
+        f"❌ פרופיל לא מוכר: {profile}\nפרופילים קיימים: {', '.join(sorted(known_profiles()))}\n"
+        "פרופיל חדש מוגדר קודם ב-routes.json."
+    )
+    return False
+
+async def apply_bulk(update, changes, profile=state_store.DEFAULT_PROFILE, sync=False):
+    """מחיל את כל השינויים בטרנזקציה אחת, טוען מחדש פעם אחת ומשיב עם סיכום"""
+    if not await _check_profile(update, profile):
+        return
+    sync = sync or changes["mode"] == "replace"
+    try:
+        diff = state_store.apply_bulk_changes(changes["ops"], profile, changes["lists"] if sync else ())
+    except Exception as e:
+        print(f"❌ שגיאה בעדכון גורף: {e}")
+        await update.message.reply_text("❌ שגיאה בשמירה. אף שינוי לא הוחל.")
+        return
+
+    if diff["filters_added"] or diff["filters_removed"]:
+        load_filters()
+    if diff["replacements_added"] or diff["replacements_updated"] or diff["replacements_removed"]:
+        load_replacements()
+
+    summary = format_bulk_summary(diff, changes, sync)
+    if profile != state_store.DEFAULT_PROFILE:
+        summary = f"🧭 פרופיל: {profile}\n" + summary
+    print(summary)
+    for i in range(0, len(summary), 4000):
+        await update.message.reply_text(summary[i:i + 4000])
+
+# 📦 פקודת /bulk: עדכון גורף מהודעה מרובת שורות (השורה הראשונה היא הפקודה עצמה)
+async def bulk_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _require_admin(update):
+        return
+
+    first_line, _, body = update.message.text.partition("\n")
+    profile, sync = parse_bulk_target(first_line.split()[1:])
+    if not body.strip():
+        await update.message.reply_text(
+            "⚠️ שימוש: /bulk ואחריו שורה לכל פעולה, לדוגמה:\n"
+            "/bulk\n+ ניקוי ביטוי\n- איסור-מילה מילה\n+ החלפה קיצור החלפה מלאה\n- החלפה קיצור\n\n"
+            "לפרופיל סינון של ערוץ אחר: /bulk <פרופיל> בשורה הראשונה.\n"
+            "לסנכרון מלא (מה שלא ברשימה מוסר): /bulk sync [פרופיל].\n"
+            "אפשר גם לשלוח קובץ (txt / csv / json) בצ'אט הפרטי, עם שם הפרופיל (ו-sync) בכיתוב."
+        )
+        return
+
+    try:
+        changes = parse_bulk(body)
+    except Exception as e:
+        await update.message.reply_text(f"❌ לא ניתן לקרוא את הרשימה: {e}")
+        return
+
+    await apply_bulk(update, changes, profile, sync)
+
+# 📄 קובץ שנשלח לבוט בצ'אט פרטי ← עדכון גורף
+async def bulk_document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _require_admin(update):
+        return
+
+    document = update.message.document
+    if document.file_size and document.file_size > BULK_MAX_BYTES:
+        await update.message.reply_text(f"❌ הקובץ גדול מדי (מעל {BULK_MAX_BYTES // 1024}KB).")
+        return
+
+    try:
+        tg_file = await document.get_file()
+        text = bytes(await tg_file.download_as_bytearray()).decode("utf-8-sig")
+        changes = parse_bulk(text, document.file_name)
+    except Exception as e:
+        await update.message.reply_text(f"❌ לא ניתן לקרוא את הקובץ: {e}")
+        return
+
+    profile, sync = parse_bulk_target((update.message.caption or "").split())
+    await apply_bulk(update, changes, profile, sync)
 
-# ✅ הוספת CommandHandler לניהול הפילטרים בצ'אט פרטי עם האדמין
-app.add_handler(CommandHandler("list_filters", list_filters_command, filters=filters.ChatType.PRIVATE))
-app.add_handler(CommandHandler("add_filter", add_filter_command, filters=filters.ChatType.PRIVATE))
-app.add_handler(CommandHandler("remove_filter", remove_filter_command, filters=filters.ChatType.PRIVATE))
-app.add_handler(CommandHandler("view_filter", view_filter_command, filters=filters.ChatType.PRIVATE))
+# 📤 פקודת /export_filters [json|txt] [פרופיל]: כל הרשימות וההחלפות כקובץ (json כברירת מחדל, או txt בפורמט של /bulk)
+async def export_filters_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _require_admin(update):
+        return
 
-# ✅ תוספת חדשה: הוספת CommandHandler לניהול החלפות מילים
-app.add_handler(CommandHandler("list_replacements", list_replacements_command, filters=filters.ChatType.PRIVATE))
-app.add_handler(CommandHandler("add_replacement", add_replacement_command, filters=filters.ChatType.PRIVATE))
-app.add_handler(CommandHandler("remove_replacement", remove_replacement_command, filters=filters.ChatType.PRIVATE))
+    fmt, profile = "json", state_store.DEFAULT_PROFILE
+    for arg in context.args:
+        if arg.lower() in ("json", "txt"):
+            fmt = arg.lower()
+        else:
+            profile = arg
+    if not await _check_profile(update, profile):
+        return
+    data = state_store.get_filters(FILTER_MAPPING.values(), profile)
+    replacements = state_store.get_replacements(profile)
 
+    if fmt == "txt":
+        lines = [f"+ {name} {item}" for name, key in FILTER_MAPPING.items() for item in data[key]]
+        lines += [f"+ {REPLACEMENTS_LIST_NAME} {k} {v}" for k, v in sorted(replacements.items())]
+        content = "\n".join(lines) + "\n"
+    else:
+        content = json.dumps(
+            {"mode": "replace", "filters": {name: data[key] for name, key in FILTER_MAPPING.items()}, "replacements": replacements},
+            ensure_ascii=False, indent=2
+        )
 
-print("🚀 הבוט מאזין לערוץ ומעלה לשלוחה 🎧")
+    # קובץ ה-JSON מסומן "mode": "replace"; ל-txt מוסיפים sync בכיתוב – כך שמחיקת שורה מהקובץ מסירה את הפריט
+    resend = " ".join(([] if fmt == "json" else ["sync"]) + ([] if profile == state_store.DEFAULT_PROFILE else [profile]))
+    total = sum(len(v) for v in data.values())
+    await update.message.reply_document(
+        document=io.BytesIO(content.encode("utf-8")),
+        filename=f"filters_{profile}.{fmt}",
+        caption=f"📤 {profile}: {total} פילטרים ו-{len(replacements)} החלפות. לעדכון – ערוך ושלח את הקובץ בחזרה"
+                + (f" עם הכיתוב: {resend}" if resend else ".")
+    )
+
+# 🧭 פקודת /routes: מסלולי הניתוב, פרופילי הסינון ומצב התקציב של כל מסלול
+async def routes_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _require_admin(update):
+        return
 
-import telegram
-telegram.Bot(BOT_TOKEN).delete_webhook()
+    lines = ["🧭 מסלולים:"]
+    for route in ROUTES.values():
+        lines.append(
+            f"\n{route.name} → {route.ymot_path}\n"
+            f"  ערוצים: {', '.join(map(str, route.chat_ids)) or 'כל השאר'}\n"
+            f"  פרופילים: {'+'.join(route.profiles)} | קול: {route.voice} ({route.speaking_rate})\n"
+            f"  מדיה: {route.active['processing']}/{route.max_concurrency or '∞'} פעילים, {route.waiting['processing']} ממתינים\n"
+            f"  TTS: {route.active['tts']}/{route.tts_concurrency or '∞'} פעילים, {route.waiting['tts']} ממתינים\n"
+            f"  העלאות: {route.active['upload']}/{route.upload_concurrency or '∞'} פעילות, {route.waiting['upload']} ממתינות\n"
+            f"  מבזקים באיחוד: {len(route.pending_bulletin)}"
+        )
+    lines.append(f"\nפרופילים במאגר: {', '.join(state_store.get_profiles()) or state_store.DEFAULT_PROFILE}")
+    await update.message.reply_text("\n".join(lines))
 
-# ▶️ לולאת הרצה אינסופית
-while True:
+# --- 🔬 כלי אבחון בזמן ריצה (אדמין בלבד): פרופיילינג, זיכרון ומשימות asyncio ---
+# אף אחד מהם לא פעיל כברירת מחדל – אין תקורה כשלא משתמשים בהם.
+
+_profile_state = None # dict כשיש פרופיילינג פעיל
+_memory_snapshot = None # צילום tracemalloc אחרון להשוואה
+TASK_CREATED_AT = weakref.WeakKeyDictionary() # משימה ← זמן יצירה (למדידת גיל ב-/tasks)
+MAX_PROFILE_SECONDS = 600
+
+async def _require_admin(update):
+    if not ADMIN_USER_ID:
+        await update.message.reply_text("❌ שגיאה: משתנה הסביבה ADMIN_USER_ID אינו מוגדר. לא ניתן לבצע פעולות ניהול.")
+        return False
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ אין לך הרשאה לבצע פעולה זו.")
+        return False
+    return True
+
+def task_factory(loop, coro, **kwargs):
+    """יוצר משימה רגילה ורושם את זמן היצירה שלה (מותקן בהפעלת הבוט)"""
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    TASK_CREATED_AT[task] = time.monotonic()
+    return task
+
+# ⏱️ פקודת /profile <N> [הודעות]: cProfile למשך N שניות או N הודעות, ושליחת הנקודות החמות
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global _profile_state
+    if not await _require_admin(update):
+        return
+
+    if not context.args or not context.args[0].isdigit() or int(context.args[0]) <= 0:
+        await update.message.reply_text("⚠️ שימוש: /profile <שניות>  או  /profile <מספר> הודעות")
+        return
+    if _profile_state is not None:
+        await update.message.reply_text("ℹ️ כבר רץ פרופיילינג. המתן לסיומו.")
+        return
+
+    count = int(context.args[0])
+    by_messages = len(context.args) > 1 and context.args[1] in ("הודעות", "messages", "msgs")
+    _profile_state = {
+        "profiler": cProfile.Profile(),
+        "messages": 0,
+        "target_messages": count if by_messages else float("inf"),
+        "done": asyncio.Event(),
+    }
+    unit = "הודעות" if by_messages else "שניות"
+    await update.message.reply_text(f"🔬 פרופיילינג התחיל ל-{count} {unit}...")
+    # הלכידה רצה ברקע – אחרת הפקודה הייתה חוסמת את הטיפול בהודעות עצמן
+    context.application.create_task(
+        _run_profile(context.bot, update.effective_chat.id, MAX_PROFILE_SECONDS if by_messages else count)
+    )
+
+async def _run_profile(bot, chat_id, timeout):
+    global _profile_state
+    state = _profile_state
+    started = time.monotonic()
+    state["profiler"].enable()
     try:
-        app.run_polling(
-            poll_interval=10.0,      # כל כמה שניות לבדוק הודעות חדשות
-            timeout=30,              # כמה זמן לחכות לפני שנזרקת שגיאת TimedOut
-            allowed_updates=Update.ALL_TYPES # לוודא שכל סוגי ההודעות נתפסים
+        await asyncio.wait_for(state["done"].wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        state["profiler"].disable()
+        _profile_state = None
+
+    out = io.StringIO()
+    stats = pstats.Stats(state["profiler"], stream=out)
+    stats.sort_stats("cumulative").print_stats(25)
+    report = out.getvalue()
+    # מקצרים נתיבים ארוכים כדי שהדוח ייכנס להודעה
+    report = re.sub(r"/\S+/(site-packages|lib/python[\d.]+)/", "", report)
+    header = (f"🔬 סיכום פרופיילינג: {time.monotonic() - started:.0f} שניות, {state['messages']} הודעות "
+              f"(רק חוט הלולאה הראשי; עבודה בחוטים/תהליכי עבודה לא נמדדת)\n\n")
+    await safe_send(bot, chat_id, header + report[:4000 - len(header)])
+
+# 🧠 פקודת /memsnap [stop]: צילומי tracemalloc והשוואה לצילום הקודם
+async def memsnap_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global _memory_snapshot
+    if not await _require_admin(update):
+        return
+
+    if context.args and context.args[0] == "stop":
+        tracemalloc.stop()
+        _memory_snapshot = None
+        await update.message.reply_text("🧠 מעקב הזיכרון הופסק.")
+        return
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _memory_snapshot = tracemalloc.take_snapshot()
+        await update.message.reply_text("🧠 מעקב זיכרון הופעל ונלקח צילום בסיס. הרץ /memsnap שוב כדי לראות גידול.")
+        return
+
+    snapshot = tracemalloc.take_snapshot()
+    diff = snapshot.compare_to(_memory_snapshot, "lineno")
+    _memory_snapshot = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"🧠 זיכרון במעקב: {current / 1024 / 1024:.1f}MB (שיא {peak / 1024 / 1024:.1f}MB)",
+             "גידול מאז הצילום הקודם:"]
+    for stat in diff[:15]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+.1f}KB ({stat.count_diff:+d}) {os.path.basename(frame.filename)}:{frame.lineno}")
+    await update.message.reply_text("\n".join(lines)[:4000])
+
+# 🧵 פקודת /tasks: משימות asyncio שרצות כרגע, לפי גיל
+async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _require_admin(update):
+        return
+
+    now = time.monotonic()
+    tasks = [t for t in asyncio.all_tasks() if not t.done()]
+    tasks.sort(key=lambda t: TASK_CREATED_AT.get(t, now)) # הוותיקות קודם
+    lines = [f"🧵 {len(tasks)} משימות פעילות:"]
+    for task in tasks[:40]:
+        created = TASK_CREATED_AT.get(task)
+        age = f"{now - created:.1f}s" if created is not None else "?"
+        stack = task.get_stack(limit=1)
+        where = f"{stack[0].f_code.co_name}:{stack[0].f_lineno}" if stack else "-"
+        coro = getattr(task.get_coro(), "__qualname__", "?")
+        lines.append(f"{age:>8}  {task.get_name()}  {coro}  @ {where}")
+    await update.message.reply_text("\n".join(lines)[:4000])
+    
+# 🌐 פקודת /http_stats: עומס והמתנה לחיבור פנוי בכל מאגר HTTP של טלגרם
+async def http_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _require_admin(update):
+        return
+
+    from http_pools import POOLS
+    lines = ["🌐 מאגרי HTTP (המתנה לחיבור פנוי, 500 הבקשות האחרונות):"]
+    for pool in POOLS:
+        st = pool.stats()
+        lines.append(
+            f"\n{st['name']} ({st['pool_size']} חיבורים, HTTP/{st['http_version']}): {st['in_flight']} פעילות, {st['waiting']} ממתינות\n"
+            f"  {st['requests']} בקשות, {st['errors']} שגיאות ({st['pool_timeouts']} בלי חיבור פנוי)\n"
+            f"  המתנה: חציון {st['wait_p50_ms']:.0f}ms, p95 {st['wait_p95_ms']:.0f}ms, מקסימום {st['wait_max_ms']:.0f}ms"
         )
+    await update.message.reply_text("\n".join(lines))
+
+# ⏱️ מדידת זמני שלבי ההפעלה
+STARTUP_PHASES = []
+
+@contextmanager
+def startup_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_PHASES.append((name, time.perf_counter() - started))
+
+def print_startup_report():
+    print("⏱️ זמני הפעלה:")
+    for name, seconds in STARTUP_PHASES:
+        print(f"   {name:<22} {seconds * 1000:8.1f}ms")
+    total = (time.perf_counter() - _PROCESS_STARTED) * 1000
+    print(f"   {'עד האזנה (סה״כ)':<22} {total:8.1f}ms")
+
+# 🟡 כתיבת קובץ מפתח Google מ־BASE64
+def write_google_credentials():
+    key_b64 = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_B64")
+    if not key_b64:
+        raise Exception("❌ משתנה GOOGLE_APPLICATION_CREDENTIALS_B64 לא מוגדר או ריק")
+
+    try:
+        with open("google_key.json", "wb") as f:
+            f.write(base64.b64decode(key_b64))
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "google_key.json"
     except Exception as e:
-        print("❌ שגיאה כללית בהרצת הבוט:", e)
-        time.sleep(30) # לחכות 30 שניות ואז להפעיל מחדש את הבוט
+        raise Exception("❌ נכשל בכתיבת קובץ JSON מ־BASE64: " + str(e))
+
+# 🚦 נקרא אחרי אתחול הבוט ולפני תחילת ההאזנה – דוח זמנים והמשך משימות שנקטעו
+async def on_startup(application):
+    print_startup_report()
+    # רישום זמן יצירה של כל משימה, עבור /tasks
+    asyncio.get_running_loop().set_task_factory(task_factory)
+    await resume_unfinished_jobs(application)
+
+# ▶️ נקודת הכניסה של הבוט
+def main():
+    with startup_phase("מפתח Google"):
+        write_google_credentials()
+
+    with startup_phase("מאגר מצב (SQLite)"):
+        # 🔄 מיגרציה חד-פעמית מקבצי ה-JSON למאגר ה-SQLite (אם טרם בוצעה)
+        try:
+            state_store.migrate_from_json(FILTERS_FILE, REPLACEMENTS_FILE, LAST_MESSAGES_FILE)
+        except Exception as e:
+            print(f"❌ נכשלה המיגרציה ל-SQLite: {e}")
+
+        # טוען את הפילטרים ואת החלפות המילים
+        try:
+            load_filters()
+        except Exception as e:
+            print(e)
+        try:
+            load_replacements()
+        except Exception as e:
+            print(e)
+
+    with startup_phase("טבלת ניתוב"):
+        try:
+            load_routes()
+        except Exception as e:
+            print(f"❌ שגיאה בטעינת {ROUTES_FILE}: {e}. כל ההודעות יועלו ל-{YMOT_PATH}.")
+
+    # ♻️ keep alive
+    with startup_phase("keep alive (Flask)"):
+        from keep_alive import keep_alive
+        keep_alive()
+
+    with startup_phase("ייבוא telegram"):
+        from telegram import Update
+        from telegram.ext import ApplicationBuilder, MessageHandler, filters, CommandHandler
+
+    # ▶️ הפעלת הבוט
+    with startup_phase("בניית הבוט"):
+        import http_pools
+        # 🌐 מאגרי חיבורים נפרדים להאזנה, להורדות ולשליחה (http_pools.py)
+        app = http_pools.configure(ApplicationBuilder().token(BOT_TOKEN).post_init(on_startup)).build()
+        app.add_handler(MessageHandler(filters.ChatType.CHANNEL, handle_message))
+
+        # ✅ הוספת CommandHandler לניהול הפילטרים בצ'אט פרטי עם האדמין
+        app.add_handler(CommandHandler("list_filters", list_filters_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("add_filter", add_filter_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("remove_filter", remove_filter_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("view_filter", view_filter_command, filters=filters.ChatType.PRIVATE))
+
+        # ✅ תוספת חדשה: הוספת CommandHandler לניהול החלפות מילים
+        app.add_handler(CommandHandler("list_replacements", list_replacements_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("add_replacement", add_replacement_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("remove_replacement", remove_replacement_command, filters=filters.ChatType.PRIVATE))
+
+        # 📦 ייבוא/ייצוא גורף
+        app.add_handler(CommandHandler("bulk", bulk_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("export_filters", export_filters_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("routes", routes_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.Document.ALL, bulk_document_handler))
+
+        # 🔬 כלי אבחון בזמן ריצה
+        app.add_handler(CommandHandler("profile", profile_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("memsnap", memsnap_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("tasks", tasks_command, filters=filters.ChatType.PRIVATE))
+        app.add_handler(CommandHandler("http_stats", http_stats_command, filters=filters.ChatType.PRIVATE))
+
+    print("🚀 הבוט מאזין לערוץ ומעלה לשלוחה 🎧")
+
+    # ℹ️ אין צורך ב-delete_webhook נפרד: run_polling מוחק את ה-webhook בעצמו לפני ההאזנה
+
+    # ▶️ לולאת הרצה אינסופית
+    try:
+        while True:
+            try:
+                app.run_polling(
+                    poll_interval=10.0,      # כל כמה שניות לבדוק הודעות חדשות
+                    timeout=30,              # כמה זמן לחכות לפני שנזרקת שגיאת TimedOut
+                    allowed_updates=Update.ALL_TYPES # לוודא שכל סוגי ההודעות נתפסים
+                )
+                break # run_polling חוזר בלי שגיאה רק אחרי בקשת עצירה (SIGINT/SIGTERM)
+            except Exception as e:
+                print("❌ שגיאה כללית בהרצת הבוט:", e)
+                time.sleep(30) # לחכות 30 שניות ואז להפעיל מחדש את הבוט
+    finally:
+        # 🧵 סגירת תהליכי העבודה של המדיה (ה-pool נשמר בין הפעלות מחדש של run_polling)
+        shutdown_pool()
+        print("👋 הבוט נעצר.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+import io
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+
+# 🎛️ כלי עיבוד מדיה (TTS / ffmpeg / ffprobe / VAD)
+# מופרדים מ-main.py כדי שתהליכי העבודה (media_worker.py) יוכלו לייבא אותם בלי להפעיל את הבוט
+
+
+# ⚡ לקוח ה-TTS נוצר בפעם הראשונה שצריך אותו (ייבוא google.cloud לוקח זמן) ומשמש שוב בהמשך
+_tts_client = None
+
+def get_tts_client():
+    global _tts_client
+    if _tts_client is None:
+        from google.cloud import texttospeech
+        _tts_client = texttospeech.TextToSpeechClient()
+    return _tts_client
+
+# 🗣️ קול ברירת המחדל להקראה (ניתוב לערוץ מסוים יכול לבחור קול/קצב אחר – routing.py)
+TTS_VOICE = os.getenv("TTS_VOICE", "he-IL-Wavenet-B")
+TTS_SPEAKING_RATE = float(os.getenv("TTS_SPEAKING_RATE", "1.2"))
+
+def text_to_mp3(text, filename='output.mp3', voice_name=None, speaking_rate=None):
+    from google.cloud import texttospeech
+    client = get_tts_client()
+    synthesis_input = texttospeech.SynthesisInput(text=text)
+    voice = texttospeech.VoiceSelectionParams(
+        language_code="he-IL",
+        name=voice_name or TTS_VOICE
+    )
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.MP3,
+        speaking_rate=speaking_rate or TTS_SPEAKING_RATE
+    )
+    response = client.synthesize_speech(
+        input=synthesis_input, voice=voice, audio_config=audio_config
+    )
+    with open(filename, "wb") as out:
+        out.write(response.audio_content)
+
+# --- 🛡️ מנהל תהליכי ffmpeg/ffprobe: הגבלת מקביליות, timeout, עדיפות והריגה בתקיעה ---
+FFMPEG_MAX_CONCURRENCY = int(os.getenv("FFMPEG_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+FFMPEG_TIMEOUT_BASE = float(os.getenv("FFMPEG_TIMEOUT_BASE", "30"))            # שניות לכל הפעלה
+FFMPEG_TIMEOUT_PER_SECOND = float(os.getenv("FFMPEG_TIMEOUT_PER_SECOND", "2"))  # שניות לכל שנייה של מדיה
+FFPROBE_TIMEOUT = float(os.getenv("FFPROBE_TIMEOUT", "15"))
+FFMPEG_NICE = int(os.getenv("FFMPEG_NICE", "10"))
+# לדוגמה: "0,1" – ריצה רק על ליבות 0 ו-1 (ריק = ללא הגבלה)
+FFMPEG_CPU_AFFINITY = {int(c) for c in os.getenv("FFMPEG_CPU_AFFINITY", "").split(",") if c.strip()}
+
+# סמפור גלובלי; במצב תהליכי עבודה מוחלף בסמפור משותף לכל התהליכים (set_process_semaphore)
+_ffmpeg_semaphore = threading.BoundedSemaphore(FFMPEG_MAX_CONCURRENCY)
+
+# 📊 סטטיסטיקות ההפעלות האחרונות (זמן ריצה, זיכרון שיא, קוד יציאה) לכיוון המגבלות
+FFMPEG_STATS = deque(maxlen=200)
+
+# 🛑 ביטול: קבוצות התהליכים שרצות כרגע בתהליך הזה, אירוע עצירה כללי (כיבוי),
+# ואירוע ביטול של המשימה שרצה בחוט הנוכחי (set_cancel_event) – לולאת ההמתנה של run_managed בודקת את שניהם
+_running = {} # pid ← Popen
+_running_lock = threading.Lock()
+_shutdown = threading.Event()
+_thread_state = threading.local()
+
+
+class MediaProcessError(Exception):
+    """הפעלת ffmpeg/ffprobe נכשלה (קוד יציאה שונה מ-0 או חריגה מזמן)"""
+
+    def __init__(self, message, returncode=None, stderr="", timed_out=False):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+        self.timed_out = timed_out
+
+
+def set_process_semaphore(semaphore):
+    """מחליף את הסמפור המקומי בסמפור משותף (multiprocessing) – נקרא באתחול כל תהליך עבודה"""
+    global _ffmpeg_semaphore
+    _ffmpeg_semaphore = semaphore
+
+
+def _limit_prefix():
+    """
+    עדיפות נמוכה והצמדה לליבות דרך nice / taskset לפני הפקודה – כך הם חלים לפני ה-exec
+    על ffmpeg ועל כל החוטים שלו. (preexec_fn לא בטוח בתהליך עם חוטים, כמו הבוט.)
+    """
+    prefix = []
+    if FFMPEG_CPU_AFFINITY and shutil.which("taskset"):
+        prefix += ["taskset", "-c", ",".join(str(c) for c in sorted(FFMPEG_CPU_AFFINITY))]
+    if FFMPEG_NICE and shutil.which("nice"):
+        prefix += ["nice", "-n", str(FFMPEG_NICE)]
+    return prefix
+
+
+def _limit_after_spawn(pid):
+    # גיבוי כשאין nice / taskset במערכת: הגבלה מיד אחרי ההפעלה (חוטים שייווצרו אחר כך יורשים אותה)
+    try:
+        if FFMPEG_NICE and not shutil.which("nice"):
+            os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, 0) + FFMPEG_NICE)
+        if FFMPEG_CPU_AFFINITY and hasattr(os, "sched_setaffinity") and not shutil.which("taskset"):
+            os.sched_setaffinity(pid, FFMPEG_CPU_AFFINITY)
+    except (ProcessLookupError, PermissionError, OSError) as e:
+        print(f"⚠️ לא ניתן להגביל את תהליך {pid}: {e}")
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def set_cancel_event(event):
+    """אירוע ביטול למשימה שרצה בחוט הנוכחי (None לניקוי). כשהוא נקבע – ה-ffmpeg הפעיל נהרג."""
+    _thread_state.cancel = event
+
+
+def kill_running():
+    """כיבוי: עוצר הפעלות חדשות והורג את כל קבוצות התהליכים שרצות כרגע בתהליך הזה"""
+    _shutdown.set()
+    with _running_lock:
+        procs = list(_running.values())
+    for proc in procs:
+        _kill_group(proc)
+
+
+def _cancelled():
+    cancel = getattr(_thread_state, "cancel", None)
+    return _shutdown.is_set() or (cancel is not None and cancel.is_set())
+
+
+def _drain(stream, chunks):
+    """קורא pipe עד הסוף לתוך רשימה (בחוט נפרד – כדי שהתהליך לא ייחסם על pipe מלא)"""
+    try:
+        for chunk in iter(lambda: stream.read(65536), b""):
+            chunks.append(chunk)
+    finally:
+        stream.close()
+
+
+def run_managed(cmd, timeout, input_bytes=None, check=True):
+    """
+    מריץ פקודת ffmpeg/ffprobe תחת הסמפור הגלובלי, עם timeout ו-stdout/stderr שנלכדים.
+    stdout/stderr נקראים מ-pipe לזיכרון (בלי קבצים זמניים), כך שפענוח pipe:0 ← pipe:1 לא נוגע בדיסק.
+    בחריגה מהזמן, בביטול המשימה (set_cancel_event) או בכיבוי (kill_running) כל קבוצת התהליכים נהרגת.
+    מחזיר dict עם returncode, stdout (bytes), stderr (str), elapsed ו-max_rss_kb.
+    """
+    name = os.path.basename(cmd[0])
+    if _cancelled():
+        raise MediaProcessError(f"{name} לא הופעל: המשימה בוטלה")
+    with _ffmpeg_semaphore:
+        started = time.monotonic()
+        proc = subprocess.Popen(
+            _limit_prefix() + cmd,
+            stdin=subprocess.PIPE if input_bytes is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True,  # קבוצת תהליכים נפרדת – כדי שנוכל להרוג הכל יחד
+        )
+        with _running_lock:
+            _running[proc.pid] = proc
+        _limit_after_spawn(proc.pid)
+        out, err = [], []
+        readers = [
+            threading.Thread(target=_drain, args=(proc.stdout, out), daemon=True),
+            threading.Thread(target=_drain, args=(proc.stderr, err), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        if input_bytes is not None:
+            def feed():
+                try:
+                    proc.stdin.write(input_bytes)
+                    proc.stdin.close()
+                except (BrokenPipeError, OSError):
+                    pass
+            threading.Thread(target=feed, daemon=True).start()
+
+        returncode = None
+        max_rss_kb = 0
+        timed_out = False
+        cancelled = False
+        try:
+            deadline = started + timeout
+            while True:
+                # wait4 מחזיר גם את צריכת המשאבים של התהליך שהסתיים
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    returncode = os.waitstatus_to_exitcode(status)
+                    proc.returncode = returncode
+                    max_rss_kb = usage.ru_maxrss
+                    break
+                if time.monotonic() > deadline:
+                    timed_out = True
+                    break
+                if _cancelled():
+                    cancelled = True
+                    break
+                time.sleep(0.05)
+        finally:
+            if returncode is None:
+                # timeout, ביטול או חריגה בלולאה – הורגים את כל הקבוצה ואוספים את התהליך
+                _kill_group(proc)
+                proc.wait()
+            with _running_lock:
+                _running.pop(proc.pid, None)
+        elapsed = time.monotonic() - started
+
+        # התהליך הסתיים (או נהרג) – ה-pipe-ים נסגרו והקוראים מסיימים
+        for reader in readers:
+            reader.join()
+        stderr = b"".join(err).decode("utf-8", errors="replace")
+        stdout = b"".join(out)
+
+    FFMPEG_STATS.append({
+        "name": name,
+        "elapsed": elapsed,
+        "max_rss_kb": max_rss_kb,
+        "returncode": proc.returncode,
+        "timed_out": timed_out,
+        "timeout": timeout,
+    })
+    print(f"⏱️ {name}: {elapsed:.2f} שניות, זיכרון שיא {max_rss_kb / 1024:.1f}MB, קוד יציאה {proc.returncode}")
+
+    if timed_out:
+        raise MediaProcessError(f"{name} חרג מהזמן ({timeout:.1f} שניות) ונהרג", proc.returncode, stderr, True)
+    if cancelled or (proc.returncode != 0 and _cancelled()): # נהרג ע"י kill_running לפני שהלולאה שמה לב
+        raise MediaProcessError(f"{name} נהרג: המשימה בוטלה", proc.returncode, stderr)
+    if check and proc.returncode != 0:
+        raise MediaProcessError(f"{name} נכשל (קוד {proc.returncode}): {stderr[-500:]}", proc.returncode, stderr)
+
+    return {
+        "returncode": proc.returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "elapsed": elapsed,
+        "max_rss_kb": max_rss_kb,
+    }
+
+
+def media_duration(path):
+    """אורך המדיה בשניות (WAV נקרא מהכותרת, אחרת ffprobe). 0 אם לא ידוע."""
+    try:
+        with wave.open(path, 'rb') as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except Exception:
+        pass
+    try:
+        result = run_managed(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+            FFPROBE_TIMEOUT
+        )
+        return float(result["stdout"].strip() or 0)
+    except (MediaProcessError, ValueError) as e:
+        print(f"⚠️ לא ניתן לקבוע את אורך המדיה: {e}")
+        return 0.0
+
+
+def ffmpeg_timeout(*paths):
+    """timeout להפעלת ffmpeg – בסיס קבוע ועוד תוספת יחסית לאורך המדיה"""
+    return FFMPEG_TIMEOUT_BASE + FFMPEG_TIMEOUT_PER_SECOND * sum(media_duration(p) for p in paths)
+
+
+def convert_to_wav(input_file, output_file='output.wav'):
+    run_managed([
+        'ffmpeg', '-nostdin', '-i', input_file, '-ar', '8000', '-ac', '1', '-f', 'wav',
+        output_file, '-y'
+    ], ffmpeg_timeout(input_file))
+
+def concat_wavs(first_wav, second_wav, output_file):
+    """שרשור שני קבצי WAV לקובץ אחד"""
+    run_managed(['ffmpeg', '-nostdin', '-i', first_wav, '-i', second_wav, '-filter_complex',
+                 '[0:a][1:a]concat=n=2:v=0:a=1[out]', '-map', '[out]', output_file, '-y'],
+                ffmpeg_timeout(first_wav, second_wav))
+
+# --- 🎧 פענוח הודעות קוליות / אודיו בזיכרון, ישר מהבתים שהורדו ---
+# av (PyAV, libavcodec בתוך התהליך) – בלי הפעלת ffmpeg בכלל; תהליכי העבודה ארוכי-החיים טוענים אותו פעם אחת.
+# בלי PyAV: ffmpeg שקורא מ-stdin וכותב PCM ל-stdout – בלי קבצים זמניים בדיסק.
+AUDIO_DECODER = os.getenv("AUDIO_DECODER", "auto") # auto / av / ffmpeg
+DECODE_BYTES_PER_SECOND = 2000 # הערכה שמרנית (16kbps) לאורך המדיה לפי הגודל – לחישוב ה-timeout
+
+_av = None
+
+def _load_av():
+    global _av
+    if _av is None:
+        try:
+            import av
+            _av = av
+        except ImportError:
+            _av = False
+            if AUDIO_DECODER == "av":
+                print("⚠️ AUDIO_DECODER=av אבל PyAV לא מותקן (pip install av) – משתמש ב-ffmpeg.")
+    return _av
+
+def decode_backend():
+    """המפענח שבשימוש: "av" או "ffmpeg" """
+    if AUDIO_DECODER != "ffmpeg" and _load_av():
+        return "av"
+    return "ffmpeg"
+
+def _decode_with_av(data, rate):
+    av = _load_av()
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=rate)
+    chunks = []
+
+    def collect(frames):
+        # PyAV 9+ מחזיר רשימה, גרסאות ישנות – פריים בודד
+        for frame in frames if isinstance(frames, list) else [frames]:
+            if frame is not None:
+                chunks.append(frame.to_ndarray().tobytes())
+
+    with av.open(io.BytesIO(data)) as container:
+        for frame in container.decode(audio=0):
+            frame.pts = None # תזמון מחדש לפי קצב הדגימה החדש
+            collect(resampler.resample(frame))
+        collect(resampler.resample(None)) # ריקון השאריות של ה-resampler
+    return b"".join(chunks)
+
+def _decode_with_ffmpeg(data, rate):
+    timeout = FFMPEG_TIMEOUT_BASE + FFMPEG_TIMEOUT_PER_SECOND * len(data) / DECODE_BYTES_PER_SECOND
+    result = run_managed(['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', 'pipe:0',
+                          '-ar', str(rate), '-ac', '1', '-f', 's16le', 'pipe:1'],
+                         timeout, input_bytes=bytes(data))
+    return result["stdout"]
+
+def decode_to_pcm(data, rate=8000, backend=None):
+    """מפענח Opus/AAC/MP3 (bytes) ל-PCM מונו 16bit בקצב rate. מחזיר bytes."""
+    backend = backend or decode_backend()
+    started = time.monotonic()
+    pcm = _decode_with_av(data, rate) if backend == "av" else _decode_with_ffmpeg(data, rate)
+    print(f"🎧 פוענחו {len(data) / 1024:.0f}KB ל-{len(pcm) / 2 / rate:.1f} שניות PCM ({backend}, {time.monotonic() - started:.3f} שניות)")
+    return pcm
+
+def decode_to_wav(data, output_file, rate=8000, backend=None):
+    """כמו convert_to_wav, אבל מהבתים שבזיכרון – כותב רק את ה-WAV הסופי"""
+    pcm = decode_to_pcm(data, rate, backend)
+    if not pcm:
+        raise MediaProcessError("הפענוח לא החזיר שמע")
+    with wave.open(output_file, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return output_file
+
+# --- 📦 קידוד הקובץ שמועלה לימות (ימות ממירה בעצמה – convertAudio=1) ---
+# pcm = WAV 16bit (ברירת המחדל הישנה), ulaw/alaw = WAV 8bit (פי 2 קטן),
+# gsm = GSM 6.10 בתוך WAV (בערך פי 8 קטן), mp3 = MP3 בקצב נמוך
+UPLOAD_CODEC = os.getenv("UPLOAD_CODEC", "pcm")
+UPLOAD_MP3_BITRATE = os.getenv("UPLOAD_MP3_BITRATE", "16k")
+
+UPLOAD_CODECS = {
+    "pcm": (['-c:a', 'pcm_s16le', '-f', 'wav'], '.wav'),
+    "ulaw": (['-c:a', 'pcm_mulaw', '-f', 'wav'], '.wav'),
+    "alaw": (['-c:a', 'pcm_alaw', '-f', 'wav'], '.wav'),
+    "gsm": (['-c:a', 'libgsm_ms', '-f', 'wav'], '.wav'),
+    "mp3": (['-c:a', 'libmp3lame', '-b:a', UPLOAD_MP3_BITRATE, '-f', 'mp3'], '.mp3'),
+}
+
+def encode_for_upload(input_file, output_base, codec=None):
+    """
+    מקודד את הקובץ לפורמט ההעלאה שנבחר (UPLOAD_CODEC) ב-8kHz מונו.
+    קובץ WAV שנוצר ע"י convert_to_wav מוחזר כמו שהוא כשהקידוד הוא pcm.
+    מחזיר את נתיב הקובץ המקודד (output_base + סיומת).
+    """
+    codec = codec or UPLOAD_CODEC
+    if codec not in UPLOAD_CODECS:
+        print(f"⚠️ קידוד העלאה לא מוכר '{codec}', משתמש ב-pcm.")
+        codec = "pcm"
+    if codec == "pcm" and input_file.endswith('.wav'):
+        # ה-WAV שלנו כבר 8kHz מונו 16bit – אין צורך בהפעלת ffmpeg נוספת
+        return input_file
+    args, ext = UPLOAD_CODECS[codec]
+    output_file = output_base + ext
+    run_managed(['ffmpeg', '-nostdin', '-i', input_file, '-ar', '8000', '-ac', '1'] + args + [output_file, '-y'],
+                ffmpeg_timeout(input_file))
+    return output_file
+
+def upload_mime_type(path):
+    return 'audio/mpeg' if path.endswith('.mp3') else 'audio/wav'
+
+def has_audio_track(file_path):
+    """בודק אם יש ערוץ שמע בקובץ וידאו"""
+    try:
+        result = run_managed(
+            ['ffprobe', '-i', file_path, '-show_streams', '-select_streams', 'a', '-loglevel', 'error'],
+            FFPROBE_TIMEOUT
+        )
+        return bool(result["stdout"].strip())
+    except Exception as e:
+        print("⚠️ שגיאה בבדיקת ffprobe:", e)
+        return False
+
+# 🗣️ החלטות VAD לכל מסגרת (True = דיבור) – משמש לבדיקת דיבור בווידאו ולחיתוך שקט
+VAD_FRAME_MS = 30
+
+def speech_frames(wav_path, frame_duration=VAD_FRAME_MS):
+    import webrtcvad
+    vad = webrtcvad.Vad(1)
+    temp_path = wav_path + '.temp.wav'
+    wf = wave.open(wav_path, 'rb')
+    try:
+        # בדיקת פורמט קובץ, אם לא 8k/16k מונו 16bit, המר
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() not in [8000, 16000]:
+            wf.close()
+            convert_to_wav(wav_path, temp_path)
+            wf = wave.open(temp_path, 'rb')
+        rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    finally:
+        wf.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    frame_size = int(rate * frame_duration / 1000) * 2
+    decisions = []
+    for i in range(0, len(frames) - frame_size + 1, frame_size):
+        decisions.append(vad.is_speech(frames[i:i+frame_size], rate))
+    return decisions
+
+# --- ✂️ חיתוך שקט בהתחלה ובסוף ונרמול עוצמה (numpy, בלי הפעלת ffmpeg נוספת) ---
+AUDIO_TRIM = os.getenv("AUDIO_TRIM", "1") == "1"
+AUDIO_TRIM_PAD_MS = int(os.getenv("AUDIO_TRIM_PAD_MS", "250"))            # שוליים שנשארים סביב הדיבור
+AUDIO_TARGET_RMS_DB = float(os.getenv("AUDIO_TARGET_RMS_DB", "-20"))      # עוצמה ממוצעת רצויה (dBFS)
+AUDIO_PEAK_DB = float(os.getenv("AUDIO_PEAK_DB", "-1"))                   # תקרת שיא (dBFS)
+AUDIO_MAX_GAIN_DB = float(os.getenv("AUDIO_MAX_GAIN_DB", "20"))          # הגברה מקסימלית – הקלטה שקטה מאוד לא הופכת לרעש מלא
+
+def trim_and_normalize(wav_path, decisions, frame_duration=VAD_FRAME_MS):
+    """
+    חותך את השקט שלפני הדיבור הראשון ואחרי האחרון (לפי החלטות ה-VAD),
+    ומנרמל את העוצמה ל-RMS רצוי בלי לחרוג מתקרת השיא ומ-AUDIO_MAX_GAIN_DB. כותב את הקובץ מחדש במקום.
+    בלי מסגרות דיבור אין הגברה כלל (רק הנמכה עד תקרת השיא) – כדי לא להגביר רחש רקע.
+    מחזיר dict עם trimmed_seconds, bytes_saved ו-gain_db.
+    """
+    import numpy as np
+
+    with wave.open(wav_path, 'rb') as wf:
+        params = wf.getparams()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2')
+    if params.nchannels != 1 or params.sampwidth != 2 or not len(samples):
+        return {"trimmed_seconds": 0.0, "bytes_saved": 0, "gain_db": 0.0}
+
+    rate = params.framerate
+    start, end = 0, len(samples)
+    speech = np.flatnonzero(np.asarray(decisions, dtype=bool))
+    if speech.size:
+        frame_len = int(rate * frame_duration / 1000)
+        pad = int(rate * AUDIO_TRIM_PAD_MS / 1000)
+        start = max(0, speech[0] * frame_len - pad)
+        end = min(len(samples), (speech[-1] + 1) * frame_len + pad)
+
+    x = samples[start:end].astype(np.float32)
+    rms = float(np.sqrt(np.mean(x * x))) if x.size else 0.0
+    peak = float(np.max(np.abs(x))) if x.size else 0.0
+    gain = 1.0
+    if rms > 0 and peak > 0:
+        target_rms = 32767 * 10 ** (AUDIO_TARGET_RMS_DB / 20)
+        max_peak = 32767 * 10 ** (AUDIO_PEAK_DB / 20)
+        max_gain = 10 ** (AUDIO_MAX_GAIN_DB / 20) if speech.size else 1.0
+        gain = min(target_rms / rms, max_peak / peak, max_gain)
+        x = np.clip(x * gain, -32768, 32767)
+
+    out = x.astype('<i2')
+    with wave.open(wav_path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(out.tobytes())
+
+    return {
+        "trimmed_seconds": (len(samples) - len(out)) / rate,
+        "bytes_saved": (len(samples) - len(out)) * 2,
+        "gain_db": 20 * float(np.log10(gain)),
+    }
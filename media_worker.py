@@ -0,0 +1,209 @@
+import os
+import time
+import signal
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import media_tools
+import state_store
+from media_tools import (
+    text_to_mp3, convert_to_wav, decode_to_wav, concat_wavs, has_audio_track, encode_for_upload,
+    speech_frames, trim_and_normalize, AUDIO_TRIM
+)
+
+# ⚙️ מספר תהליכי עבודה לעיבוד מדיה (0 = עיבוד בתוך התהליך הראשי, בחוט נפרד)
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "0"))
+
+# 🔊 זיהוי מדיה כפולה לפי טביעת אצבע קולית (גם אחרי קידוד מחדש)
+MEDIA_FINGERPRINT = os.getenv("MEDIA_FINGERPRINT", "1") == "1"
+MAX_MEDIA_FINGERPRINTS = int(os.getenv("MAX_MEDIA_FINGERPRINTS", "300"))
+FINGERPRINT_MIN_MATCHES = int(os.getenv("FINGERPRINT_MIN_MATCHES", "20"))
+FINGERPRINT_MIN_RATIO = float(os.getenv("FINGERPRINT_MIN_RATIO", "0.15"))
+
+_pool = None
+
+# 📦 פורמט משימה (dict) שעובר מהתהליך הראשי לתהליכי העבודה:
+#   job_id    – מזהה המשימה (update_id של טלגרם)
+#   kind      – "video" או "audio"
+#   input     – נתיב קובץ המדיה שהורד
+#   input_bytes – (אודיו בלבד, במקום input) תוכן הקובץ שהורד לזיכרון – מפוענח בלי דיסק ובלי הפעלת ffmpeg לכל קובץ
+#   tts_text  – טקסט מלא להקראה (TTS) שיצורף לפני שמע הוידאו (או None)
+#   work_dir  – תיקיית עבודה ייחודית למשימה
+#   route     – שם המסלול (routing.py) – טביעות האצבע נבדקות מול המדיה של אותו מסלול בלבד
+#   voice, speaking_rate – קול ההקראה של המסלול
+#
+# 📬 פורמט תוצאה (dict):
+#   job_id, status ("ok" / "rejected" / "error"), reason, output (נתיב הקובץ המקודד להעלאה),
+#   fingerprinted (האם נשמרה טביעת אצבע בשם job_id),
+#   trim (שניות שנחתכו / בתים שנחסכו / הגברה, או None), elapsed (שניות), worker_pid
+
+
+def check_duplicate_audio(job_id, wav_path, route="default"):
+    """מחשב טביעת אצבע ל-PCM ובודק מול האינדקס של המסלול. מחזיר סיבת דחייה אם זו מדיה כפולה."""
+    from audio_fingerprint import read_pcm, compute_fingerprint # numpy נטען רק כשצריך
+    fingerprint = compute_fingerprint(read_pcm(wav_path))
+    if not fingerprint:
+        return None
+    match = state_store.claim_fingerprint(
+        job_id, fingerprint, MAX_MEDIA_FINGERPRINTS, FINGERPRINT_MIN_MATCHES, FINGERPRINT_MIN_RATIO, route
+    )
+    if match:
+        _, matches = match
+        return f"⏩ מדיה זהה כבר הועלתה ({matches} התאמות בטביעת האצבע) – לא תועלה לשלוחה."
+    return None
+
+
+def process_media_job(job):
+    """מריץ את שלבי העיבוד של מדיה: בדיקת שמע, המרה, VAD, TTS ושרשור"""
+    started = time.monotonic()
+    result = {
+        "job_id": job["job_id"],
+        "status": "ok",
+        "reason": None,
+        "output": None,
+        "fingerprinted": False,
+        "trim": None,
+        "worker_pid": os.getpid(),
+    }
+    work_dir = job["work_dir"]
+    media_path = os.path.join(work_dir, "media.wav")
+
+    try:
+        if job["kind"] == "video":
+            # בדיקת שמע בוידאו
+            if not has_audio_track(job["input"]):
+                result.update(status="rejected", reason="⛔️ הודעה לא נשלחה: וידאו ללא שמע.")
+                return result
+
+            video_wav = os.path.join(work_dir, "video.wav")
+            convert_to_wav(job["input"], video_wav)
+
+            # בדיקת דיבור אנושי – החלטות ה-VAD נשמרות גם לחיתוך השקט
+            decisions = speech_frames(video_wav)
+            if not any(decisions):
+                result.update(status="rejected", reason="⛔️ הודעה לא נשלחה: שמע אינו דיבור אנושי.")
+                return result
+            if AUDIO_TRIM:
+                result["trim"] = trim_and_normalize(video_wav, decisions)
+
+            if MEDIA_FINGERPRINT:
+                reason = check_duplicate_audio(job["job_id"], video_wav, job.get("route", "default"))
+                if reason:
+                    result.update(status="rejected", reason=reason)
+                    return result
+                result["fingerprinted"] = True
+
+            if job.get("tts_text"):
+                # ה-TTS נוצר רק אחרי שהוידאו עבר את הבדיקות
+                text_mp3 = os.path.join(work_dir, "text.mp3")
+                text_wav = os.path.join(work_dir, "text.wav")
+                text_to_mp3(job["tts_text"], text_mp3, job.get("voice"), job.get("speaking_rate"))
+                convert_to_wav(text_mp3, text_wav)
+                # שרשור TTS + וידאו אודיו
+                concat_wavs(text_wav, video_wav, media_path)
+            else:
+                os.rename(video_wav, media_path)
+        else:
+            if job.get("input_bytes") is not None:
+                try:
+                    decode_to_wav(job["input_bytes"], media_path)
+                except Exception as e:
+                    # למשל AAC/M4A שה-moov שלו בסוף הקובץ (ffmpeg מ-pipe לא יכול לחזור אחורה) – דרך הקובץ
+                    print(f"⚠️ פענוח בזיכרון נכשל ({job['job_id']}), ממיר דרך קובץ:", e)
+                    input_path = os.path.join(work_dir, "audio.ogg")
+                    with open(input_path, "wb") as f:
+                        f.write(job["input_bytes"])
+                    convert_to_wav(input_path, media_path)
+            else:
+                convert_to_wav(job["input"], media_path)
+            if AUDIO_TRIM:
+                # בהקלטה בלי דיבור מזוהה לא חותכים ולא מגבירים (רק הנמכה עד תקרת השיא)
+                try:
+                    result["trim"] = trim_and_normalize(media_path, speech_frames(media_path))
+                except Exception as e:
+                    print(f"⚠️ חיתוך שקט נכשל ({job['job_id']}), מעלים בלי חיתוך:", e)
+
+            if MEDIA_FINGERPRINT:
+                reason = check_duplicate_audio(job["job_id"], media_path, job.get("route", "default"))
+                if reason:
+                    result.update(status="rejected", reason=reason)
+                    return result
+                result["fingerprinted"] = True
+
+        # קידוד סופי לפורמט ההעלאה (UPLOAD_CODEC)
+        result["output"] = encode_for_upload(media_path, os.path.join(work_dir, "upload"))
+        return result
+    except Exception as e:
+        if result["fingerprinted"]:
+            state_store.release_fingerprint(job["job_id"])
+            result["fingerprinted"] = False
+        result.update(status="error", reason=f"❌ שגיאה בעיבוד מדיה: {e}")
+        return result
+    finally:
+        result["elapsed"] = time.monotonic() - started
+
+
+def _init_worker(semaphore):
+    media_tools.set_process_semaphore(semaphore)
+    # SIGTERM מ-shutdown_pool: הורגים את ה-ffmpeg שרץ (קבוצת תהליכים נפרדת – לא יקבל את האות בעצמו) ויוצאים
+    signal.signal(signal.SIGTERM, _terminate_worker)
+
+
+def _terminate_worker(signum, frame):
+    media_tools.kill_running()
+    os._exit(1)
+
+
+def get_pool():
+    """יוצר (פעם אחת) את מאגר תהליכי העבודה. spawn – כדי לא לשכפל את תהליך הבוט עם החוטים שלו."""
+    global _pool
+    if _pool is None and MEDIA_WORKERS > 0:
+        ctx = multiprocessing.get_context("spawn")
+        # סמפור משותף – מגבלת ה-ffmpeg במקביל חלה על כל התהליכים יחד
+        semaphore = ctx.BoundedSemaphore(media_tools.FFMPEG_MAX_CONCURRENCY)
+        media_tools.set_process_semaphore(semaphore)
+        _pool = ProcessPoolExecutor(
+            max_workers=MEDIA_WORKERS, mp_context=ctx,
+            initializer=_init_worker, initargs=(semaphore,)
+        )
+        print(f"🧵 הופעל מאגר של {MEDIA_WORKERS} תהליכי עבודה לעיבוד מדיה.")
+    return _pool
+
+
+async def run_media_job(job):
+    """מריץ משימה במאגר התהליכים (או בחוט של התהליך הנוכחי אם MEDIA_WORKERS=0)"""
+    pool = get_pool()
+    if pool is None:
+        # בחוט ולא ישירות – כדי שמסלולים אחרים ימשיכו לעבוד בזמן העיבוד.
+        # ביטול המשימה (asyncio) מפעיל את אירוע הביטול – ה-ffmpeg שרץ בחוט נהרג ולא ממשיך עד ה-timeout
+        cancel = threading.Event()
+
+        def run():
+            media_tools.set_cancel_event(cancel)
+            try:
+                return process_media_job(job)
+            finally:
+                media_tools.set_cancel_event(None)
+
+        try:
+            return await asyncio.to_thread(run)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, process_media_job, job)
+
+
+def shutdown_pool():
+    """כיבוי: הורג את ה-ffmpeg של משימות שרצות (בחוטים ובתהליכי העבודה) וסוגר את המאגר"""
+    global _pool
+    media_tools.kill_running()
+    if _pool is not None:
+        # shutdown לא עוצר משימות שכבר רצות – שולחים SIGTERM לתהליכי העבודה (_terminate_worker)
+        for process in list(getattr(_pool, "_processes", {}).values()):
+            if process.is_alive():
+                process.terminate()
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
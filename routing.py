@@ -0,0 +1,153 @@
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+from state_store import DEFAULT_PROFILE
+from media_tools import TTS_VOICE, TTS_SPEAKING_RATE
+from media_worker import MEDIA_WORKERS
+
+# 🧭 ניתוב לפי ערוץ מקור: כל ערוץ (chat_id) מוזן לשלוחה משלו, עם קול הקראה, פרופיל סינון
+# ומגבלת מקביליות משלו – כך שערוץ וידאו כבד לא מעכב ערוץ מבזקים מהיר.
+#
+# routes.json (לא חובה – בלעדיו כל ההודעות הולכות ל-YMOT_PATH, כמו קודם):
+# {
+#   "routes": [
+#     {"name": "sport", "chat_ids": [-1001234567890], "ymot_path": "ivr2:91/",
+#      "filters": ["default", "sport"], "voice": "he-IL-Wavenet-A", "speaking_rate": 1.1,
+#      "max_concurrency": 2, "tts_concurrency": 1, "upload_concurrency": 1}
+#   ]
+# }
+# filters – פרופילי סינון (פילטרים + החלפות), מאוחדים לפי הסדר; ערוצים עם אותם פרופילים חולקים את אותם מסננים מהודרים.
+# מסלול בלי chat_ids בשם "default" מחליף את ברירת המחדל (לכל ערוץ שלא הוגדר).
+#
+# תקציבים נפרדים לכל מסלול, כך שמבזק טקסט לא ממתין מאחורי וידאו:
+#   max_concurrency    – הורדה ועיבוד מדיה (ברירת מחדל: MEDIA_WORKERS; 0 = ללא הגבלה)
+#   tts_concurrency    – הקראת מבזקי טקסט (1 = המבזקים מוקראים לפי הסדר)
+#   upload_concurrency – תור ההעלאות לשלוחה
+# היסטוריית הכפילויות (טקסט, file_unique_id וטביעות אצבע) נשמרת לכל מסלול בנפרד (state_store.py).
+
+ROUTES_FILE = os.getenv("ROUTES_FILE", "routes.json")
+ROUTE_MAX_CONCURRENCY = int(os.getenv("ROUTE_MAX_CONCURRENCY", str(MEDIA_WORKERS)))  # 0 = ללא הגבלה
+ROUTE_TTS_CONCURRENCY = int(os.getenv("ROUTE_TTS_CONCURRENCY", "1"))
+ROUTE_UPLOAD_CONCURRENCY = int(os.getenv("ROUTE_UPLOAD_CONCURRENCY", "1"))
+SLOT_KINDS = ("processing", "tts", "upload")
+
+
+def _limit(value, default):
+    return int(default if value is None else value)
+
+
+class Route:
+    """יעד אחד: שלוחה, קול, פרופילי סינון ותקציבי מקביליות (עיבוד מדיה, TTS, תור העלאות)"""
+
+    def __init__(self, name, ymot_path=None, voice=None, speaking_rate=None, filters=None,
+                 max_concurrency=None, tts_concurrency=None, upload_concurrency=None, chat_ids=()):
+        self.name = name
+        self.ymot_path = ymot_path or os.getenv("YMOT_PATH", "ivr2:90/")
+        self.voice = voice or TTS_VOICE
+        self.speaking_rate = float(speaking_rate or TTS_SPEAKING_RATE)
+        if isinstance(filters, str):
+            filters = [filters]
+        self.profiles = tuple(filters or (DEFAULT_PROFILE,))
+        self.max_concurrency = _limit(max_concurrency, ROUTE_MAX_CONCURRENCY)
+        self.tts_concurrency = _limit(tts_concurrency, ROUTE_TTS_CONCURRENCY)
+        self.upload_concurrency = _limit(upload_concurrency, ROUTE_UPLOAD_CONCURRENCY)
+        self.chat_ids = [int(c) for c in chat_ids]
+
+        # 📰 איחוד מבזקים – לכל ערוץ יעד תור משלו (main.publish_text)
+        self.pending_bulletin = [] # זוגות (job_id, טקסט)
+        self.bulletin_timer = None
+
+        # הסמפורים והמנעול נוצרים בתוך הלולאה הפעילה (הלולאה מתחלפת בכל הפעלה מחדש של run_polling)
+        self._loop = None
+        self._semaphores = {}
+        self._bulletin_lock = None
+        self.active = {kind: 0 for kind in SLOT_KINDS}
+        self.waiting = {kind: 0 for kind in SLOT_KINDS}
+
+    def limit(self, kind):
+        return {"processing": self.max_concurrency, "tts": self.tts_concurrency, "upload": self.upload_concurrency}[kind]
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            # מגבלה 0 = ללא סמפור (ללא הגבלה)
+            self._semaphores = {kind: asyncio.Semaphore(self.limit(kind)) for kind in SLOT_KINDS if self.limit(kind) > 0}
+            self._bulletin_lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def slot(self, kind):
+        """
+        תופס מקום בתקציב המסלול: "processing" (הורדה ועיבוד מדיה), "tts" (הקראת מבזקי טקסט)
+        או "upload" (תור ההעלאות לשלוחה). הסמפור הוגן – ממתינים לפי סדר ההגעה.
+        """
+        self._bind()
+        semaphore = self._semaphores.get(kind)
+        if semaphore is not None:
+            self.waiting[kind] += 1
+            try:
+                await semaphore.acquire()
+            finally:
+                self.waiting[kind] -= 1
+        self.active[kind] += 1
+        try:
+            yield
+        finally:
+            self.active[kind] -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+    @property
+    def bulletin_lock(self):
+        self._bind()
+        return self._bulletin_lock
+
+    def __repr__(self):
+        return f"Route({self.name!r} → {self.ymot_path}, פרופילים={'+'.join(self.profiles)})"
+
+
+DEFAULT_ROUTE = Route("default")
+ROUTES = {DEFAULT_ROUTE.name: DEFAULT_ROUTE}
+CHAT_ROUTES = {} # chat_id ← Route
+
+
+def load_routes(path=ROUTES_FILE):
+    """טוען את טבלת הניתוב (אם קיים קובץ). מחזיר את רשימת המסלולים."""
+    global DEFAULT_ROUTE
+    if not os.path.exists(path):
+        return list(ROUTES.values())
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("routes", []) if isinstance(data, dict) else data
+
+    # בונים את הכל לפני ההחלפה – קובץ שגוי לא משאיר טבלה חלקית
+    routes, chat_routes = {}, {}
+    for entry in entries:
+        route = Route(**entry)
+        routes[route.name] = route
+        for chat_id in route.chat_ids:
+            chat_routes[chat_id] = route
+    DEFAULT_ROUTE = routes.setdefault("default", DEFAULT_ROUTE)
+
+    ROUTES.clear()
+    ROUTES.update(routes)
+    CHAT_ROUTES.clear()
+    CHAT_ROUTES.update(chat_routes)
+
+    for route in ROUTES.values():
+        print(f"🧭 {route}: ערוצים {route.chat_ids or 'כל השאר'}, מדיה {route.max_concurrency or 'ללא הגבלה'}, "
+              f"TTS {route.tts_concurrency or 'ללא הגבלה'}, העלאות {route.upload_concurrency or 'ללא הגבלה'}")
+    return list(ROUTES.values())
+
+
+def route_for(chat_id):
+    """המסלול של ערוץ המקור (או ברירת המחדל)"""
+    return CHAT_ROUTES.get(chat_id, DEFAULT_ROUTE)
+
+
+def get_route(name):
+    """המסלול לפי שם (למשימות שנשמרו ביומן); מסלול שהוסר ← ברירת המחדל"""
+    return ROUTES.get(name, DEFAULT_ROUTE)
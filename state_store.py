@@ -0,0 +1,596 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+# 🗄️ מאגר מצב משותף (SQLite במצב WAL) – פילטרים, החלפות מילים והיסטוריית הודעות
+STATE_DB_FILE = os.getenv("STATE_DB_FILE", "state.db")
+DEFAULT_PROFILE = "default" # פרופיל הסינון של הערוץ הראשי (ושל כל הפקודות בלי פרופיל מפורש)
+REPLACEMENTS_LIST = "REPLACEMENTS" # מפתח ה"רשימה" של החלפות המילים בעדכון גורף
+
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS filters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile TEXT NOT NULL DEFAULT 'default',
+    list_key TEXT NOT NULL,
+    item TEXT NOT NULL,
+    UNIQUE (profile, list_key, item)
+);
+CREATE TABLE IF NOT EXISTS replacements (
+    profile TEXT NOT NULL DEFAULT 'default',
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (profile, key)
+);
+CREATE TABLE IF NOT EXISTS message_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    route TEXT NOT NULL DEFAULT 'default'
+);
+CREATE INDEX IF NOT EXISTS idx_message_history_created ON message_history (created_at);
+CREATE TABLE IF NOT EXISTS media_seen (
+    route TEXT NOT NULL DEFAULT 'default',
+    file_unique_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (route, file_unique_id)
+);
+CREATE INDEX IF NOT EXISTS idx_media_seen_created ON media_seen (created_at);
+CREATE TABLE IF NOT EXISTS media_fingerprint_index (
+    media_key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    route TEXT NOT NULL DEFAULT 'default'
+);
+CREATE TABLE IF NOT EXISTS media_fingerprints (
+    media_key TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    t INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_fingerprints_hash ON media_fingerprints (hash);
+CREATE INDEX IF NOT EXISTS idx_media_fingerprints_key ON media_fingerprints (media_key);
+CREATE TABLE IF NOT EXISTS jobs (
+    update_id INTEGER PRIMARY KEY,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    artifacts TEXT NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_stage ON jobs (stage);
+"""
+
+
+def get_connection():
+    """מחזיר חיבור פתוח למסד (אחד לכל תהליך/חוט)"""
+    conn = getattr(_local, "conn", None)
+    # אחרי fork לא משתמשים בחיבור של תהליך האב
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        return conn
+
+    conn = sqlite3.connect(STATE_DB_FILE, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    _migrate_profiles(conn)
+    _migrate_routes(conn)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def _migrate_profiles(conn):
+    """מסד ישן (לפני פרופילי הסינון): בונה מחדש את filters ו-replacements עם עמודת profile"""
+    def has_profile():
+        return any(row[1] == "profile" for row in conn.execute("PRAGMA table_info(filters)"))
+
+    if has_profile():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not has_profile(): # תהליך אחר אולי כבר ביצע את המיגרציה
+            for statement in (
+                "ALTER TABLE filters RENAME TO filters_old",
+                "ALTER TABLE replacements RENAME TO replacements_old",
+            ):
+                conn.execute(statement)
+            for statement in SCHEMA.split(";"):
+                if "filters (" in statement or "replacements (" in statement:
+                    conn.execute(statement)
+            conn.execute("INSERT INTO filters (id, list_key, item) SELECT id, list_key, item FROM filters_old")
+            conn.execute("INSERT INTO replacements (key, value) SELECT key, value FROM replacements_old")
+            conn.execute("DROP TABLE filters_old")
+            conn.execute("DROP TABLE replacements_old")
+            print("✅ מאגר המצב עודכן: נוספו פרופילי סינון (הרשימות הקיימות שויכו לפרופיל 'default').")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _migrate_routes(conn):
+    """מסד ישן (לפני הניתוב): היסטוריית הכפילויות מקבלת עמודת route; הרשומות הקיימות שייכות למסלול 'default'"""
+    def has_route():
+        return any(row[1] == "route" for row in conn.execute("PRAGMA table_info(media_seen)"))
+
+    if has_route():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not has_route():
+            conn.execute("ALTER TABLE message_history ADD COLUMN route TEXT NOT NULL DEFAULT 'default'")
+            conn.execute("ALTER TABLE media_fingerprint_index ADD COLUMN route TEXT NOT NULL DEFAULT 'default'")
+            # למפתח הראשי של media_seen נוסף route – בונים את הטבלה מחדש
+            conn.execute("ALTER TABLE media_seen RENAME TO media_seen_old")
+            conn.execute("DROP INDEX IF EXISTS idx_media_seen_created")
+            for statement in SCHEMA.split(";"):
+                if "media_seen" in statement:
+                    conn.execute(statement)
+            conn.execute("INSERT INTO media_seen (file_unique_id, created_at) SELECT file_unique_id, created_at FROM media_seen_old")
+            conn.execute("DROP TABLE media_seen_old")
+            print("✅ מאגר המצב עודכן: בדיקת הכפילויות נפרדת לכל מסלול (ההיסטוריה הקיימת שויכה למסלול 'default').")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+class transaction:
+    """עטיפה ל-BEGIN IMMEDIATE ... COMMIT, עם ROLLBACK במקרה של שגיאה"""
+
+    def __enter__(self):
+        self.conn = get_connection()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+# --- 🔄 מיגרציה חד-פעמית מקבצי ה-JSON הישנים ---
+def migrate_from_json(filters_file, replacements_file, last_messages_file):
+    conn = get_connection()
+    row = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+    if row:
+        return False
+
+    def read_json(path, default):
+        if not os.path.exists(path):
+            return default
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ שגיאה בקריאת {path} במהלך המיגרציה: {e}")
+            return default
+
+    filters_data = read_json(filters_file, {})
+    replacements_data = read_json(replacements_file, {})
+    messages = read_json(last_messages_file, [])
+
+    with transaction() as c:
+        if isinstance(filters_data, dict):
+            for list_key, items in filters_data.items():
+                c.executemany(
+                    "INSERT OR IGNORE INTO filters (list_key, item) VALUES (?, ?)",
+                    [(list_key, str(item)) for item in items]
+                )
+        if isinstance(replacements_data, dict):
+            c.executemany(
+                "INSERT OR REPLACE INTO replacements (key, value) VALUES (?, ?)",
+                [(str(k), str(v)) for k, v in replacements_data.items()]
+            )
+        if isinstance(messages, list):
+            now = time.time()
+            c.executemany(
+                "INSERT INTO message_history (text, created_at) VALUES (?, ?)",
+                [(str(m), now) for m in messages]
+            )
+        c.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(time.time()),))
+
+    print(f"✅ מיגרציה ל-SQLite הושלמה: {sum(len(v) for v in filters_data.values()) if isinstance(filters_data, dict) else 0} פילטרים, "
+          f"{len(replacements_data)} החלפות, {len(messages)} הודעות בהיסטוריה.")
+    return True
+
+
+# --- 🧹 פילטרים ---
+def get_filters(list_keys, profile=DEFAULT_PROFILE):
+    data = {k: [] for k in list_keys}
+    rows = get_connection().execute(
+        "SELECT list_key, item FROM filters WHERE profile = ? ORDER BY id", (profile,)
+    ).fetchall()
+    for list_key, item in rows:
+        if list_key in data:
+            data[list_key].append(item)
+    return data
+
+
+def add_filter_item(list_key, item, profile=DEFAULT_PROFILE):
+    """מוסיף פריט לרשימה. מחזיר False אם כבר קיים."""
+    cur = get_connection().execute(
+        "INSERT OR IGNORE INTO filters (profile, list_key, item) VALUES (?, ?, ?)", (profile, list_key, item)
+    )
+    return cur.rowcount > 0
+
+
+def remove_filter_item(list_key, item, profile=DEFAULT_PROFILE):
+    """מסיר פריט מרשימה. מחזיר False אם לא נמצא."""
+    cur = get_connection().execute(
+        "DELETE FROM filters WHERE profile = ? AND list_key = ? AND item = ?", (profile, list_key, item)
+    )
+    return cur.rowcount > 0
+
+
+# --- 🔁 החלפות מילים ---
+def get_replacements(profile=DEFAULT_PROFILE):
+    rows = get_connection().execute(
+        "SELECT key, value FROM replacements WHERE profile = ?", (profile,)
+    ).fetchall()
+    return dict(rows)
+
+
+def set_replacement(key, value, profile=DEFAULT_PROFILE):
+    get_connection().execute(
+        "INSERT OR REPLACE INTO replacements (profile, key, value) VALUES (?, ?, ?)", (profile, key, value)
+    )
+
+
+def remove_replacement(key, profile=DEFAULT_PROFILE):
+    cur = get_connection().execute(
+        "DELETE FROM replacements WHERE profile = ? AND key = ?", (profile, key)
+    )
+    return cur.rowcount > 0
+
+
+def get_profiles():
+    """כל פרופילי הסינון שיש להם פילטרים או החלפות"""
+    rows = get_connection().execute(
+        "SELECT profile FROM filters UNION SELECT profile FROM replacements ORDER BY profile"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+# --- 📦 עדכון גורף (ייבוא רשימות) ---
+def apply_bulk_changes(ops, profile=DEFAULT_PROFILE, sync_lists=()):
+    """
+    מחיל הוספות/הסרות של פילטרים והחלפות בטרנזקציה אחת – הכל או כלום, לפי סדר הקלט.
+    ops: רשימה מסודרת של (op, list_key, item, value) – op הוא "+" או "-", list_key הוא REPLACEMENTS_LIST עבור החלפות.
+    sync_lists: רשימות שמסונכרנות במלואן (מצב replace) – התוכן הרצוי הוא תוצאת ops על רשימות ריקות,
+    ומוחל רק ההפרש מול התוכן הנוכחי (פריטים שלא מופיעים בקלט מוסרים).
+    מחזיר dict עם השינוי נטו מול המצב שלפני (הוספה והסרה של אותו פריט מתקזזות).
+    """
+    diff = {
+        "filters_added": [], "filters_removed": [],
+        "replacements_added": [], "replacements_updated": [], "replacements_removed": [],
+    }
+    with transaction() as c:
+        if sync_lists:
+            ops = _sync_ops(c, ops, set(sync_lists) | {op[1] for op in ops}, profile)
+
+        def current(list_key, item):
+            # ערך ההחלפה, True לפילטר קיים, או None אם לא קיים
+            if list_key == REPLACEMENTS_LIST:
+                row = c.execute("SELECT value FROM replacements WHERE profile = ? AND key = ?", (profile, item)).fetchone()
+                return row[0] if row else None
+            row = c.execute(
+                "SELECT 1 FROM filters WHERE profile = ? AND list_key = ? AND item = ?", (profile, list_key, item)
+            ).fetchone()
+            return True if row else None
+
+        before = {} # (list_key, item) ← מצב לפני הפעולה הראשונה עליו, לפי סדר ההופעה
+        for op, list_key, item, value in ops:
+            if (list_key, item) not in before:
+                before[(list_key, item)] = current(list_key, item)
+            if list_key == REPLACEMENTS_LIST and op == "-":
+                c.execute("DELETE FROM replacements WHERE profile = ? AND key = ?", (profile, item))
+            elif list_key == REPLACEMENTS_LIST:
+                c.execute(
+                    "INSERT OR REPLACE INTO replacements (profile, key, value) VALUES (?, ?, ?)", (profile, item, value)
+                )
+            elif op == "-":
+                c.execute(
+                    "DELETE FROM filters WHERE profile = ? AND list_key = ? AND item = ?", (profile, list_key, item)
+                )
+            else:
+                c.execute(
+                    "INSERT OR IGNORE INTO filters (profile, list_key, item) VALUES (?, ?, ?)", (profile, list_key, item)
+                )
+
+        for (list_key, item), old in before.items():
+            new = current(list_key, item)
+            if old == new:
+                continue
+            if list_key != REPLACEMENTS_LIST:
+                diff["filters_added" if new else "filters_removed"].append((list_key, item))
+            elif new is None:
+                diff["replacements_removed"].append(item)
+            else:
+                diff["replacements_added" if old is None else "replacements_updated"].append((item, new))
+    return diff
+
+
+def _sync_ops(c, ops, lists, profile):
+    """ממיר ops במצב סנכרון לפעולות ההפרש: הסרת מה שלא נשאר, ואז הוספת התוכן הרצוי לפי הסדר"""
+    wanted = {list_key: {} for list_key in lists} # list_key ← {פריט: ערך}, לפי סדר ההופעה
+    for op, list_key, item, value in ops:
+        if op == "-":
+            wanted[list_key].pop(item, None)
+        else:
+            wanted[list_key][item] = value
+
+    result = []
+    for list_key in sorted(lists):
+        if list_key == REPLACEMENTS_LIST:
+            current = [row[0] for row in c.execute(
+                "SELECT key FROM replacements WHERE profile = ? ORDER BY key", (profile,)
+            )]
+        else:
+            current = [row[0] for row in c.execute(
+                "SELECT item FROM filters WHERE profile = ? AND list_key = ? ORDER BY id", (profile, list_key)
+            )]
+        result += [("-", list_key, item, None) for item in current if item not in wanted[list_key]]
+        result += [("+", list_key, item, value) for item, value in wanted[list_key].items()]
+    return result
+
+
+# --- 📜 היסטוריית הודעות (לבדיקת כפילות) ---
+# ההיסטוריה וטביעות המדיה נשמרות לכל מסלול (routing.Route.name) בנפרד: אותו מבזק
+# שמגיע לשתי שלוחות שונות אינו כפילות, אבל ערוצים שמוזנים לאותו מסלול חולקים היסטוריה.
+def get_recent_messages(limit, route="default"):
+    rows = get_connection().execute(
+        "SELECT text FROM message_history WHERE route = ? ORDER BY id DESC LIMIT ?", (route, limit)
+    ).fetchall()
+    return [r[0] for r in reversed(rows)]
+
+
+def append_message(text, max_history, route="default", job_id=None):
+    """
+    מוסיף הודעה להיסטוריה של המסלול ומוחק רשומות ישנות מעבר ל-max_history.
+    עם job_id – הרשומה נרשמת גם ביומן המשימה, באותה טרנזקציה (release_job_claims).
+    """
+    with transaction() as c:
+        cur = c.execute(
+            "INSERT INTO message_history (text, created_at, route) VALUES (?, ?, ?)", (text, time.time(), route)
+        )
+        c.execute(
+            "DELETE FROM message_history WHERE route = ? AND id < "
+            "(SELECT MIN(id) FROM (SELECT id FROM message_history WHERE route = ? ORDER BY id DESC LIMIT ?))",
+            (route, route, max_history)
+        )
+        if job_id is not None:
+            _record_claim(c, job_id, "history_id", cur.lastrowid)
+        return cur.lastrowid
+
+
+def remove_message(message_id):
+    get_connection().execute("DELETE FROM message_history WHERE id = ?", (message_id,))
+
+
+# --- 🎞️ כפילות מדיה: file_unique_id וטביעות אצבע קוליות ---
+def claim_media(file_unique_id, max_entries, route="default", job_id=None):
+    """
+    רושם file_unique_id במסלול. מחזיר False אם כבר נרשם בו (מדיה כפולה).
+    עם job_id – הרישום נשמר גם ביומן המשימה, באותה טרנזקציה (release_job_claims).
+    """
+    with transaction() as c:
+        cur = c.execute(
+            "INSERT OR IGNORE INTO media_seen (route, file_unique_id, created_at) VALUES (?, ?, ?)",
+            (route, file_unique_id, time.time())
+        )
+        c.execute(
+            "DELETE FROM media_seen WHERE route = ? AND file_unique_id IN "
+            "(SELECT file_unique_id FROM media_seen WHERE route = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (route, route, max_entries)
+        )
+        claimed = cur.rowcount > 0
+        if claimed and job_id is not None:
+            _record_claim(c, job_id, "media", [route, file_unique_id])
+        return claimed
+
+
+def release_media(file_unique_id, route="default"):
+    get_connection().execute(
+        "DELETE FROM media_seen WHERE route = ? AND file_unique_id = ?", (route, file_unique_id)
+    )
+
+
+def _fingerprint_matches(c, media_key, route, new_only=False):
+    # new_only – רק טביעות שנשמרו אחרי צילום המצב (לא מופיעות ב-fp_known)
+    return c.execute(
+        "SELECT f.media_key, f.t - q.t AS off, COUNT(*) FROM fp_query q "
+        "JOIN media_fingerprints f ON f.hash = q.hash "
+        "JOIN media_fingerprint_index i ON i.media_key = f.media_key "
+        "WHERE f.media_key != ? AND i.route = ? "  # משימה שחודשה מהיומן אחרי ששמרה טביעה – לא כפילות של עצמה
+        + ("AND i.media_key NOT IN (SELECT media_key FROM fp_known) " if new_only else "")
+        + "GROUP BY f.media_key, off",
+        (media_key, route)
+    ).fetchall()
+
+
+def _best_fingerprint_match(rows):
+    # היסט של מסגרת אחת לכאן או לכאן נחשב אותו היסט (קידוד מחדש מזיז מעט את הזמנים)
+    counts = {}
+    for key, off, count in rows:
+        counts[(key, off)] = counts.get((key, off), 0) + count
+    best_key, best_count = None, 0
+    for (key, off), count in counts.items():
+        total = count + counts.get((key, off + 1), 0)
+        if total > best_count:
+            best_key, best_count = key, total
+    return best_key, best_count
+
+
+def claim_fingerprint(media_key, fingerprint, max_entries, min_matches, min_ratio, route="default"):
+    """
+    מחפש במאגר המסלול מדיה עם אותה טביעת אצבע (אותם hash-ים באותו היסט זמן).
+    אם נמצאה – מחזיר (media_key הקיים, מספר התאמות). אחרת שומר את הטביעה ומחזיר None.
+    החיפוש הכבד רץ בטרנזקציית קריאה (WAL – לא חוסם כתיבות של יומן המשימות); נעילת הכתיבה
+    נלקחת רק לבדיקה חוזרת מול טביעות שנוספו בינתיים ולשמירה – כך ששני עותקים במקביל לא יעברו שניהם.
+    """
+    conn = get_connection()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS fp_query (hash INTEGER, t INTEGER)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS fp_known (media_key TEXT PRIMARY KEY)")
+    threshold = max(min_matches, min_ratio * len(fingerprint))
+    try:
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM fp_query")
+            conn.execute("DELETE FROM fp_known")
+            conn.executemany("INSERT INTO fp_query (hash, t) VALUES (?, ?)", fingerprint)
+            conn.execute(
+                "INSERT INTO fp_known (media_key) SELECT media_key FROM media_fingerprint_index WHERE route = ?", (route,)
+            )
+            rows = _fingerprint_matches(conn, media_key, route)
+        finally:
+            conn.execute("COMMIT")
+
+        best_key, best_count = _best_fingerprint_match(rows)
+        if best_key is not None and best_count >= threshold:
+            return best_key, best_count
+
+        with transaction() as c:
+            best_key, best_count = _best_fingerprint_match(rows + _fingerprint_matches(c, media_key, route, new_only=True))
+            if best_key is not None and best_count >= threshold:
+                return best_key, best_count
+
+            c.execute(
+                "INSERT OR REPLACE INTO media_fingerprint_index (media_key, created_at, route) VALUES (?, ?, ?)",
+                (media_key, time.time(), route)
+            )
+            c.execute("DELETE FROM media_fingerprints WHERE media_key = ?", (media_key,))
+            c.executemany(
+                "INSERT INTO media_fingerprints (media_key, hash, t) VALUES (?, ?, ?)",
+                [(media_key, h, t) for h, t in fingerprint]
+            )
+            old_keys = c.execute(
+                "SELECT media_key FROM media_fingerprint_index WHERE route = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                (route, max_entries)
+            ).fetchall()
+            for (old_key,) in old_keys:
+                c.execute("DELETE FROM media_fingerprints WHERE media_key = ?", (old_key,))
+                c.execute("DELETE FROM media_fingerprint_index WHERE media_key = ?", (old_key,))
+            return None
+    finally:
+        conn.execute("DELETE FROM fp_query")
+        conn.execute("DELETE FROM fp_known")
+
+
+def release_fingerprint(media_key):
+    with transaction() as c:
+        c.execute("DELETE FROM media_fingerprints WHERE media_key = ?", (media_key,))
+        c.execute("DELETE FROM media_fingerprint_index WHERE media_key = ?", (media_key,))
+
+
+# --- 📒 יומן משימות (update_id ← שלב בצנרת + תוצרי ביניים) ---
+FINISHED_STAGES = ("done", "rejected", "failed")
+
+
+def _job_row(row):
+    update_id, stage, payload, artifacts, attempts = row
+    return {
+        "update_id": update_id,
+        "stage": stage,
+        "payload": json.loads(payload),
+        "artifacts": json.loads(artifacts),
+        "attempts": attempts,
+    }
+
+
+def begin_job(update_id, payload, max_finished):
+    """פותח רשומה ל-update_id חדש. מחזיר False אם העדכון כבר נקלט בעבר (כפילות)."""
+    now = time.time()
+    with transaction() as c:
+        cur = c.execute(
+            "INSERT OR IGNORE INTO jobs (update_id, stage, payload, created_at, updated_at) "
+            "VALUES (?, 'received', ?, ?, ?)",
+            (update_id, json.dumps(payload, ensure_ascii=False), now, now)
+        )
+        # ניקוי משימות ישנות שהסתיימו – שומרים רק את max_finished האחרונות
+        c.execute(
+            "DELETE FROM jobs WHERE stage IN ('done', 'rejected', 'failed') AND update_id < "
+            "(SELECT MIN(update_id) FROM (SELECT update_id FROM jobs ORDER BY update_id DESC LIMIT ?))",
+            (max_finished,)
+        )
+        return cur.rowcount > 0
+
+
+def update_job(update_id, stage, payload=None, artifacts=None):
+    """מעדכן שלב; payload/artifacts ממוזגים לערכים הקיימים"""
+    with transaction() as c:
+        row = c.execute("SELECT payload, artifacts FROM jobs WHERE update_id = ?", (update_id,)).fetchone()
+        if row is None:
+            return
+        current_payload, current_artifacts = json.loads(row[0]), json.loads(row[1])
+        if payload:
+            current_payload.update(payload)
+        if artifacts:
+            current_artifacts.update(artifacts)
+        c.execute(
+            "UPDATE jobs SET stage = ?, payload = ?, artifacts = ?, updated_at = ? WHERE update_id = ?",
+            (stage, json.dumps(current_payload, ensure_ascii=False),
+             json.dumps(current_artifacts, ensure_ascii=False), time.time(), update_id)
+        )
+
+
+def get_job(update_id):
+    row = get_connection().execute(
+        "SELECT update_id, stage, payload, artifacts, attempts FROM jobs WHERE update_id = ?", (update_id,)
+    ).fetchone()
+    return _job_row(row) if row else None
+
+
+def _record_claim(c, update_id, key, value):
+    # רישומי הכפילות של המשימה נשמרים ב-artifacts["claims"] – כדי שהרצה חוזרת לא תיפסל כ"כפילות" של עצמה
+    row = c.execute("SELECT artifacts FROM jobs WHERE update_id = ?", (update_id,)).fetchone()
+    if row is None:
+        return
+    artifacts = json.loads(row[0])
+    artifacts.setdefault("claims", {})[key] = value
+    c.execute(
+        "UPDATE jobs SET artifacts = ?, updated_at = ? WHERE update_id = ?",
+        (json.dumps(artifacts, ensure_ascii=False), time.time(), update_id)
+    )
+
+
+def release_job_claims(update_id):
+    """מוחק את רשומות ההיסטוריה וה-media_seen שהמשימה עצמה יצרה (לפני הרצה חוזרת של הצנרת)"""
+    with transaction() as c:
+        row = c.execute("SELECT artifacts FROM jobs WHERE update_id = ?", (update_id,)).fetchone()
+        if row is None:
+            return
+        artifacts = json.loads(row[0])
+        claims = artifacts.pop("claims", {})
+        if claims.get("history_id") is not None:
+            c.execute("DELETE FROM message_history WHERE id = ?", (claims["history_id"],))
+        if claims.get("media"):
+            route, file_unique_id = claims["media"]
+            c.execute("DELETE FROM media_seen WHERE route = ? AND file_unique_id = ?", (route, file_unique_id))
+        c.execute(
+            "UPDATE jobs SET artifacts = ?, updated_at = ? WHERE update_id = ?",
+            (json.dumps(artifacts, ensure_ascii=False), time.time(), update_id)
+        )
+
+
+def claim_unfinished_jobs():
+    """מחזיר את כל המשימות שלא הסתיימו, ומעלה את מונה הניסיונות של כל אחת"""
+    with transaction() as c:
+        c.execute(
+            "UPDATE jobs SET attempts = attempts + 1 WHERE stage NOT IN ('done', 'rejected', 'failed')"
+        )
+        rows = c.execute(
+            "SELECT update_id, stage, payload, artifacts, attempts FROM jobs "
+            "WHERE stage NOT IN ('done', 'rejected', 'failed') ORDER BY update_id"
+        ).fetchall()
+    return [_job_row(r) for r in rows]